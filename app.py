@@ -1,11 +1,35 @@
-from flask import Flask, request, jsonify, send_file, render_template_string, redirect, url_for
+from flask import Flask, Request, Response, request, g, has_app_context, jsonify, redirect, url_for
 import sqlite3
 import os
 import uuid
 import datetime
+import hashlib
+import json
+import base64
+import gzip
+import threading
+import atexit
+import time
+import mmap
+import itertools
+from stat import S_ISREG
+import struct
+from collections import deque, OrderedDict
+from functools import wraps
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+try:
+    import brotli
+except ImportError:  # Optional: without it the index page is offered gzip-compressed only
+    brotli = None
+from urllib.parse import quote as url_quote
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 import mimetypes
+import click
 
 app = Flask(__name__)
 
@@ -15,14 +39,175 @@ DATABASE = 'fileshare.db'
 MAX_FILE_SIZE = 1 * 1024 * 1024 * 1024  # 1GB in bytes
 ALLOWED_EXTENSIONS = None  # Allow all file types
 
+# Database connections are pooled per worker and tuned once when opened
+DB_POOL_MAX_IDLE = 16
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_CACHE_SIZE_KB = 64 * 1024  # 64MB page cache per connection
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 256MB memory-mapped reads
+# Data migrations rewrite large tables in short batches so the write lock is never held for long
+MIGRATION_BATCH_SIZE = 5000
+MIGRATION_BATCH_PAUSE = 0.05  # seconds between batches, letting request writers in
+
+# Chunked upload sessions
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+MAX_CHUNK_SIZE = 64 * 1024 * 1024  # 64MB
+UPLOAD_SESSION_TTL = datetime.timedelta(hours=24)
+UPLOAD_SESSIONS_MAX_RESERVED = 8 * 1024 * 1024 * 1024  # 8GB preallocated by open sessions at most
+# Retention: files unused or uploaded this long ago are removed by a background worker that one
+# process at a time runs, in short batches
+FILE_RETENTION = datetime.timedelta(days=30)
+RETENTION_INTERVAL = 3600  # seconds between sweeps at most; 0 disables the background worker
+RETENTION_MIN_WAIT = 60  # seconds between sweeps at least, when expiries come due back to back
+RETENTION_BATCH_SIZE = 500  # files removed per write transaction at most
+RETENTION_BATCH_TIME = 0.25  # seconds a batch may hold the write lock before it commits early
+RETENTION_BATCH_PAUSE = 0.05  # seconds between batches, letting request writers in
+RETENTION_LEADER_RETRY = 10  # seconds between a non-leader's attempts to take over the retention lock
+# /admin/cleanup may be served by any process: it bumps a counter in a small memory-mapped file
+# next to the database, which the leader checks this often while it waits
+SWEEP_REQUEST_FILE = f'{DATABASE}.sweep-requests'
+SWEEP_REQUEST_POLL = 1  # seconds
+# Quota mode: when set, files are evicted by EVICTION_POLICY whenever the bytes on disk exceed
+# the quota, right after the upload that took them over and, as a backstop, on the retention
+# worker's quota checks. Bytes on disk are counted once per blob (stats.stored_bytes, which also
+# covers files stored before content addressing) plus deleted content still waiting in the
+# reclaim folder (stats.reclaim_bytes); duplicate uploads add nothing.
+STORAGE_QUOTA_BYTES = None
+EVICTION_POLICY = 'lru'  # 'lru' (least recently used), 'lfu' (least downloaded) or 'gdsf'
+EVICTION_TARGET_RATIO = 0.9  # evict down to this share of the quota, leaving room for bursts
+QUOTA_CHECK_INTERVAL = 5  # seconds between quota checks in the retention worker
+# Two-phase deletion: deletes rename content into the reclaim folder (same filesystem, so the
+# rename is atomic and instant) and queue it; a background reclaimer unlinks it later
+RECLAIM_FOLDER = os.path.join(UPLOAD_FOLDER, '.reclaim')
+RECLAIM_INTERVAL = 5  # seconds between reclaim queue checks; 0 reclaims inline after each delete
+RECLAIM_BYTES_PER_SECOND = 256 * 1024 * 1024  # unlink throughput cap, to spare request I/O
+RECLAIM_TRUNCATE_STEP = 1024 * 1024 * 1024  # huge files are shrunk this much at a time before unlink
+# Consistency scrubber (flask scrub): walks the upload folder and the tables a batch at a time,
+# remembering where it got to so a pass can be spread over many runs
+SCRUB_BATCH_SIZE = 1000
+SCRUB_BATCH_PAUSE = 0.05  # seconds between batches, letting request writers in
+SCRUB_PHASES = ('upload_folder', 'files', 'blobs', 'download_logs')
+STREAM_BUFFER_SIZE = 1024 * 1024  # 1MB
+
+# Downloads
+MAX_RANGES = 32  # Larger multi-range requests are answered with the whole file
+DOWNLOAD_SENDFILE = True  # Send file bytes with os.sendfile instead of copying them through Python
+# Let a fronting proxy stream the bytes: None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd).
+# For nginx, map the prefix to the upload folder with an internal location, e.g.
+#     location /protected-uploads/ { internal; alias /srv/simpleshare/uploads/; }
+DOWNLOAD_OFFLOAD = None
+DOWNLOAD_ACCEL_PREFIX = '/protected-uploads/'
+# Download counters and download_logs rows are buffered and written in one transaction per flush.
+# A crashed worker loses at most this window; an interval of 0 writes every download through.
+DOWNLOAD_FLUSH_INTERVAL_MS = 500
+DOWNLOAD_FLUSH_MAX_EVENTS = 1000
+# While flushes keep failing, at most this many downloads wait for a retry; older ones are dropped
+DOWNLOAD_BACKLOG_MAX_EVENTS = 100000
+
+# File listing
+FILES_PAGE_SIZE = 100
+MAX_FILES_PAGE_SIZE = 1000
+# Sortable columns of /api/files; each has an index on (column, id) for keyset pagination
+FILES_SORT_COLUMNS = ('upload_date', 'file_size', 'original_name', 'download_count')
+FILE_LISTING_COLUMNS = 'id, original_name, description, uploader, upload_date, file_size, download_count'
+EXPORT_BATCH_SIZE = 1000  # rows fetched per step while streaming /api/files/export
+# Delta sync: the change log keeps this many recent entries; older clients reload the full list
+CHANGE_LOG_MAX_ROWS = 100000
+CHANGES_PAGE_SIZE = 1000
+# Server-Sent Events: each worker tails the change log once for all of its subscribers. Under a
+# threaded or sync server every open stream holds a request thread (a whole sync worker) for as
+# long as the client stays connected, so streams are off unless enabled; the page then polls
+# /api/changes. Enable them only where the server has threads to spare for each open tab. The
+# page reads this setting when it is rendered at startup.
+SSE_ENABLED = False
+SSE_POLL_INTERVAL = 0.5  # seconds; also how quickly other workers' changes reach subscribers
+SSE_HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments on idle streams
+SSE_EVENT_BACKLOG = 64  # recent events kept so slow subscribers can catch up without a reset
+# Streams per worker process, leaving the rest of its threads for ordinary requests; the page
+# falls back to polling /api/changes when turned away
+SSE_MAX_SUBSCRIBERS = 32
+# Response cache for /api/files and /api/stats, invalidated by a write generation shared by all
+# worker processes through a small memory-mapped file next to the database
+GENERATION_FILE = f'{DATABASE}.generation'
+RESPONSE_CACHE_TTL = 30  # seconds; bounds staleness from writers that bypass the app, 0 disables
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['UPLOAD_SESSIONS_MAX_RESERVED'] = UPLOAD_SESSIONS_MAX_RESERVED
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['DOWNLOAD_SENDFILE'] = DOWNLOAD_SENDFILE
+app.config['DOWNLOAD_OFFLOAD'] = DOWNLOAD_OFFLOAD
+app.config['DOWNLOAD_ACCEL_PREFIX'] = DOWNLOAD_ACCEL_PREFIX
+app.config['DOWNLOAD_FLUSH_INTERVAL_MS'] = DOWNLOAD_FLUSH_INTERVAL_MS
+app.config['DOWNLOAD_FLUSH_MAX_EVENTS'] = DOWNLOAD_FLUSH_MAX_EVENTS
+app.config['RESPONSE_CACHE_TTL'] = RESPONSE_CACHE_TTL
+app.config['SSE_ENABLED'] = SSE_ENABLED
+app.config['SSE_MAX_SUBSCRIBERS'] = SSE_MAX_SUBSCRIBERS
+app.config['RETENTION_INTERVAL'] = RETENTION_INTERVAL
+app.config['STORAGE_QUOTA_BYTES'] = STORAGE_QUOTA_BYTES
+app.config['EVICTION_POLICY'] = EVICTION_POLICY
+app.config['RECLAIM_FOLDER'] = RECLAIM_FOLDER
+app.config['RECLAIM_INTERVAL'] = RECLAIM_INTERVAL
 
-# Ensure upload directory exists
+# Ensure upload and reclaim directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(RECLAIM_FOLDER, exist_ok=True)
+
+class UploadSpool:
+    """File part of an upload, written straight into the upload folder and hashed as it arrives"""
+    
+    def __init__(self, filename):
+        self.file_id = str(uuid.uuid4())
+        self.original_name = secure_filename(filename or '')
+        self.path = os.path.join(app.config['UPLOAD_FOLDER'], self.file_id + '.upload')
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.kept = False
+        self._file = open(self.path, 'w+b')
+    
+    def write(self, data):
+        self.size += len(data)
+        self.sha256.update(data)
+        return self._file.write(data)
+    
+    def keep(self):
+        """Finish writing and keep the file on disk"""
+        self._file.close()
+        self.kept = True
+    
+    def discard(self):
+        """Close and remove the file unless it was kept"""
+        self._file.close()
+        if not self.kept and os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class DirectUploadRequest(Request):
+    """Request whose uploaded files skip Werkzeug's temporary spool file"""
+    
+    upload_spools = None
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'upload_file':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        
+        spool = UploadSpool(filename)
+        if self.upload_spools is None:
+            self.upload_spools = []
+        self.upload_spools.append(spool)
+        return spool
+    
+    def close(self):
+        # Parts that were never kept (empty filename, aborted or failed upload) must not linger
+        for spool in self.upload_spools or ():
+            spool.discard()
+        super().close()
+
+app.request_class = DirectUploadRequest
 
 def init_database():
-    """Initialize the SQLite database with required tables"""
+    """Initialize the SQLite database with required tables and apply pending migrations"""
     conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
     
@@ -53,54 +238,1628 @@ def init_database():
         )
     ''')
     
-    conn.commit()
-    conn.close()
+    # Create upload_sessions table for resumable chunked uploads
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            original_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            description TEXT,
+            uploader TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create upload_chunks table recording which chunks have landed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            session_id TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (session_id, chunk_index),
+            FOREIGN KEY (session_id) REFERENCES upload_sessions (id)
+        )
+    ''')
+    
+    # Create blobs table: one physical file per content digest, shared by files rows
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            stored_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    conn.commit()
+    
+    run_migrations(conn)
+    conn.close()
+
+@contextmanager
+def file_lock(name, blocking=True):
+    """Cross-process lock on a file next to the database; yields whether the lock is held"""
+    if fcntl is None:
+        yield True
+        return
+    
+    with open(f'{DATABASE}.{name}.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def backfill_in_batches(conn, table, statement, params=None):
+    """Run `statement` over `table` one rowid range at a time, committing after each range.
+    
+    The statement must restrict itself to `rowid > :low AND rowid <= :high`. Each batch is its
+    own short write transaction, so a backfill over millions of rows never blocks request
+    writers for more than one batch, and an interrupted backfill simply starts over.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COALESCE(MIN(rowid), 1) - 1, COALESCE(MAX(rowid), 0) FROM {table}')
+    low, max_rowid = cursor.fetchone()
+    
+    while low < max_rowid:
+        high = low + MIGRATION_BATCH_SIZE
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(statement, dict(params or {}, low=low, high=high))
+        conn.commit()
+        low = high
+        time.sleep(MIGRATION_BATCH_PAUSE)
+
+def migrate_wal_and_indexes(conn):
+    """WAL journal and an index behind every query the app issues"""
+    cursor = conn.cursor()
+    # WAL lets readers carry on while a writer commits; the mode is stored in the database file
+    cursor.execute('PRAGMA journal_mode = WAL')
+    # api_files ordering and the files_today range in api_stats
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_upload_date ON files (upload_date)')
+    # cleanup_old_files: with both indexes the OR predicate becomes a multi-index OR lookup
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_last_accessed ON files (last_accessed)')
+    # delete_file removes a file's download_logs rows
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_download_logs_file_id ON download_logs (file_id)')
+    # cleanup_old_files drops abandoned upload sessions
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated_at ON upload_sessions (updated_at)')
+
+def migrate_files_sha256(conn):
+    """Content digest column on files, for databases created before content addressing"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(files)')
+    if 'sha256' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE files ADD COLUMN sha256 TEXT')
+
+def migrate_listing_indexes(conn):
+    """Keyset pagination indexes for every sort order and filter of /api/files"""
+    cursor = conn.cursor()
+    for column in FILES_SORT_COLUMNS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_files_{column}_id ON files ({column}, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_uploader ON files (uploader, upload_date, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_mime_type ON files (mime_type, upload_date, id)')
+    # Superseded by idx_files_upload_date_id, which also serves the files_today range
+    cursor.execute('DROP INDEX IF EXISTS idx_files_upload_date')
+
+def migrate_change_log(conn):
+    """Change log of files inserts, deletes and visible updates, filled by triggers"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id TEXT NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Triggers catch every write path, including ones that touch many rows in one statement
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert_change AFTER INSERT ON files
+        BEGIN
+            INSERT INTO file_changes (file_id, op) VALUES (NEW.id, 'insert');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_change AFTER DELETE ON files
+        BEGIN
+            INSERT INTO file_changes (file_id, op) VALUES (OLD.id, 'delete');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_update_change
+        AFTER UPDATE OF original_name, description, uploader, file_size, download_count ON files
+        BEGIN
+            INSERT INTO file_changes (file_id, op) VALUES (NEW.id, 'update');
+        END
+    ''')
+
+def migrate_stats_rollup(conn):
+    """Rollup tables behind /api/stats, kept current by triggers on files"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_files INTEGER NOT NULL DEFAULT 0,
+            total_size INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_uploads (
+            day TEXT PRIMARY KEY,
+            files INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Every statement that adds or removes files rows, however many at once, adjusts the rollups
+    # in its own transaction
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert_stats AFTER INSERT ON files
+        BEGIN
+            UPDATE stats SET total_files = total_files + 1, total_size = total_size + NEW.file_size WHERE id = 1;
+            INSERT INTO daily_uploads (day, files, bytes) VALUES (substr(NEW.upload_date, 1, 10), 1, NEW.file_size)
+                ON CONFLICT (day) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_stats AFTER DELETE ON files
+        BEGIN
+            UPDATE stats SET total_files = total_files - 1, total_size = total_size - OLD.file_size WHERE id = 1;
+            UPDATE daily_uploads SET files = files - 1, bytes = bytes - OLD.file_size
+                WHERE day = substr(OLD.upload_date, 1, 10);
+            DELETE FROM daily_uploads WHERE day = substr(OLD.upload_date, 1, 10) AND files <= 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_update_stats AFTER UPDATE OF file_size, upload_date ON files
+        BEGIN
+            UPDATE stats SET total_size = total_size - OLD.file_size + NEW.file_size WHERE id = 1;
+            UPDATE daily_uploads SET files = files - 1, bytes = bytes - OLD.file_size
+                WHERE day = substr(OLD.upload_date, 1, 10);
+            INSERT INTO daily_uploads (day, files, bytes) VALUES (substr(NEW.upload_date, 1, 10), 1, NEW.file_size)
+                ON CONFLICT (day) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+            DELETE FROM daily_uploads WHERE day = substr(OLD.upload_date, 1, 10) AND files <= 0;
+        END
+    ''')
+    conn.commit()
+    # Seed the rollups; one aggregate pass in the same transaction as the read, so no write is
+    # counted twice or missed
+    reconcile_stats(conn, repair=True)
+
+def reconcile_stats(conn, repair=False):
+    """Recompute the stats rollups from files and return the drift found as a list of
+    (key, stored, actual). With repair, the rollups are rewritten to the recomputed values."""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM files')
+        actual = {'total_files': 0, 'total_size': 0}
+        actual['total_files'], actual['total_size'] = cursor.fetchone()
+        cursor.execute('''
+            SELECT substr(upload_date, 1, 10), COUNT(*), SUM(file_size)
+            FROM files
+            GROUP BY substr(upload_date, 1, 10)
+        ''')
+        for day, files, size in cursor.fetchall():
+            actual[f'{day} files'] = files
+            actual[f'{day} bytes'] = size
+        
+        stored = {}
+        cursor.execute('SELECT total_files, total_size FROM stats WHERE id = 1')
+        row = cursor.fetchone()
+        if row:
+            stored['total_files'], stored['total_size'] = row
+        cursor.execute('SELECT day, files, bytes FROM daily_uploads')
+        for day, files, size in cursor.fetchall():
+            stored[f'{day} files'] = files
+            stored[f'{day} bytes'] = size
+        
+        drift = [(key, stored.get(key), actual.get(key))
+                 for key in sorted(set(stored) | set(actual)) if stored.get(key) != actual.get(key)]
+        
+        if repair and drift:
+            cursor.execute('''
+                INSERT INTO stats (id, total_files, total_size) VALUES (1, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET total_files = excluded.total_files, total_size = excluded.total_size
+            ''', (actual['total_files'], actual['total_size']))
+            cursor.execute('DELETE FROM daily_uploads')
+            cursor.execute('''
+                INSERT INTO daily_uploads (day, files, bytes)
+                SELECT substr(upload_date, 1, 10), COUNT(*), SUM(file_size)
+                FROM files
+                GROUP BY substr(upload_date, 1, 10)
+            ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if repair and drift:
+        data_changed()
+    return drift
+
+# SQL for a file's GDSF priority: the inflation clock plus its frequency per byte, so small, often
+# downloaded files stay longest and everything ages as the clock advances with each eviction
+GDSF_PRIORITY = '(SELECT gdsf_clock FROM stats WHERE id = 1) + ({downloads} + 1.0) / MAX({size}, 1)'
+
+def retention_modifier():
+    """SQLite date modifier adding FILE_RETENTION to a timestamp"""
+    return f'+{int(FILE_RETENTION.total_seconds())} seconds'
+
+def migrate_files_expires_at(conn):
+    """Indexed expiry time on files, so retention reads only the files that are due"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(files)')
+    if 'expires_at' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE files ADD COLUMN expires_at TIMESTAMP')
+    conn.commit()
+    
+    backfill_in_batches(conn, 'files', '''
+        UPDATE files SET expires_at = datetime(COALESCE(last_accessed, upload_date, CURRENT_TIMESTAMP), :retention)
+        WHERE rowid > :low AND rowid <= :high AND expires_at IS NULL
+    ''', {'retention': retention_modifier()})
+    
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_expires_at ON files (expires_at)')
+    # Only the old OR sweep used it, and every download flush had to maintain it
+    cursor.execute('DROP INDEX IF EXISTS idx_files_last_accessed')
+
+def migrate_reclaim_queue(conn):
+    """Queue of deleted content waiting in the reclaim folder to be unlinked"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reclaim_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trash_name TEXT NOT NULL UNIQUE,
+            stored_name TEXT NOT NULL,
+            file_size INTEGER NOT NULL,
+            queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def migrate_scrub_progress(conn):
+    """Resume point of the consistency scrubber, and the index its upload folder checks use"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrub_progress (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            phase TEXT NOT NULL,
+            position TEXT NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_stored_name ON files (stored_name)')
+
+def migrate_gdsf_priority(conn):
+    """Greedy-Dual-Size-Frequency eviction priority on files, and the inflation clock it is
+    measured against"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(files)')
+    if 'gdsf_priority' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE files ADD COLUMN gdsf_priority REAL')
+    cursor.execute('PRAGMA table_info(stats)')
+    if 'gdsf_clock' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE stats ADD COLUMN gdsf_clock REAL NOT NULL DEFAULT 0')
+    conn.commit()
+    
+    backfill_in_batches(conn, 'files', '''
+        UPDATE files SET gdsf_priority = (COALESCE(download_count, 0) + 1.0) / MAX(file_size, 1)
+        WHERE rowid > :low AND rowid <= :high AND gdsf_priority IS NULL
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_gdsf_priority ON files (gdsf_priority)')
+
+def migrate_stored_bytes(conn):
+    """Physical storage totals for quota mode, kept current by triggers: each blob once, files
+    stored before content addressing (no sha256, so no blob) on their own, and the reclaim queue"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(stats)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'stored_bytes' not in columns:
+        cursor.execute('ALTER TABLE stats ADD COLUMN stored_bytes INTEGER NOT NULL DEFAULT 0')
+    if 'reclaim_bytes' not in columns:
+        cursor.execute('ALTER TABLE stats ADD COLUMN reclaim_bytes INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_blobs_insert_stored AFTER INSERT ON blobs
+        BEGIN
+            UPDATE stats SET stored_bytes = stored_bytes + NEW.file_size WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_blobs_delete_stored AFTER DELETE ON blobs
+        BEGIN
+            UPDATE stats SET stored_bytes = stored_bytes - OLD.file_size WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert_stored AFTER INSERT ON files WHEN NEW.sha256 IS NULL
+        BEGIN
+            UPDATE stats SET stored_bytes = stored_bytes + NEW.file_size WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_stored AFTER DELETE ON files WHEN OLD.sha256 IS NULL
+        BEGIN
+            UPDATE stats SET stored_bytes = stored_bytes - OLD.file_size WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reclaim_queue_insert_bytes AFTER INSERT ON reclaim_queue
+        BEGIN
+            UPDATE stats SET reclaim_bytes = reclaim_bytes + NEW.file_size WHERE id = 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reclaim_queue_delete_bytes AFTER DELETE ON reclaim_queue
+        BEGIN
+            UPDATE stats SET reclaim_bytes = reclaim_bytes - OLD.file_size WHERE id = 1;
+        END
+    ''')
+    # Seed the totals in the same transaction as the triggers, so no write is counted twice or missed
+    cursor.execute('''
+        UPDATE stats SET
+            stored_bytes = (SELECT COALESCE(SUM(file_size), 0) FROM blobs)
+                         + (SELECT COALESCE(SUM(file_size), 0) FROM files WHERE sha256 IS NULL),
+            reclaim_bytes = (SELECT COALESCE(SUM(file_size), 0) FROM reclaim_queue)
+        WHERE id = 1
+    ''')
+
+# Ordered schema migrations as (version, function). Every migration must be idempotent: a
+# migration interrupted part way is simply run again at the next startup.
+MIGRATIONS = [
+    (1, migrate_wal_and_indexes),
+    (2, migrate_files_sha256),
+    (3, migrate_listing_indexes),
+    (4, migrate_change_log),
+    (5, migrate_stats_rollup),
+    (6, migrate_files_expires_at),
+    (7, migrate_reclaim_queue),
+    (8, migrate_scrub_progress),
+    (9, migrate_gdsf_priority),
+    (10, migrate_stored_bytes),
+]
+
+def run_migrations(conn):
+    """Apply every migration newer than the database's PRAGMA user_version, in order"""
+    # Workers starting together take turns; whoever comes second finds nothing left to do
+    with file_lock('migrate'):
+        cursor = conn.cursor()
+        for version, migrate in MIGRATIONS:
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] >= version:
+                continue
+            
+            print(f"Applying database migration {version}: {migrate.__doc__}")
+            started = time.monotonic()
+            migrate(conn)
+            conn.commit()
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+            print(f"Migration {version} done in {time.monotonic() - started:.2f}s")
+
+class PooledConnection(sqlite3.Connection):
+    """Connection handed out by the pool; close() rolls back anything left open and returns it"""
+    
+    pool = None
+    pid = None
+    checked_out = False
+    request_bound = False
+    
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        # A request keeps its connection until teardown, however often its code calls close()
+        if self.checked_out and not self.request_bound:
+            self.pool.checkin(self)
+
+class ConnectionPool:
+    """Idle SQLite connections of this worker process, reused instead of reconnecting per request"""
+    
+    def __init__(self, database, max_idle):
+        self.database = database
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.idle = []
+    
+    def connect(self):
+        """Open a new connection and apply the per-connection pragmas once"""
+        conn = sqlite3.connect(self.database, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        conn.pid = os.getpid()
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        return conn
+    
+    def checkout(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Connections must never cross a fork; a forked worker starts with an empty pool
+                self.pid = os.getpid()
+                self.idle = []
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self.connect()
+        conn.checked_out = True
+        return conn
+    
+    def checkin(self, conn):
+        conn.checked_out = False
+        conn.request_bound = False
+        with self.lock:
+            if conn.pid == self.pid and len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        sqlite3.Connection.close(conn)
+
+db_pool = ConnectionPool(DATABASE, DB_POOL_MAX_IDLE)
+
+def get_db_connection():
+    """Get database connection: the request's own pooled connection inside a request, otherwise
+    one checked out of the pool until close() is called"""
+    if not has_app_context():
+        return db_pool.checkout()
+    
+    if 'db' not in g:
+        g.db = db_pool.checkout()
+        g.db.request_bound = True
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.request_bound = False
+        conn.close()
+
+class DownloadRecorder:
+    """Write-behind buffer for download counters and download_logs rows.
+    
+    Each worker process aggregates downloads in memory and a background thread flushes them
+    every DOWNLOAD_FLUSH_INTERVAL_MS, or sooner once DOWNLOAD_FLUSH_MAX_EVENTS are pending, so all
+    downloads in a window cost one write transaction instead of one each. Workers share nothing
+    but the database, so this holds across any number of processes.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.counts = {}
+        self.logs = []
+        self.dropped = 0
+    
+    def record(self, file_id, ip_address):
+        """Count one download of file_id"""
+        download_date = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            if self.pid != os.getpid():
+                self._start()
+            self.counts[file_id] = self.counts.get(file_id, 0) + 1
+            self.logs.append((file_id, download_date, ip_address))
+            pending = len(self.logs)
+        
+        if app.config['DOWNLOAD_FLUSH_INTERVAL_MS'] <= 0:
+            self.flush()
+        elif pending >= app.config['DOWNLOAD_FLUSH_MAX_EVENTS']:
+            self.wakeup.set()
+    
+    def _start(self):
+        # Called with the lock held, in a fresh process or one just forked from the master;
+        # anything buffered before a fork belongs to the parent
+        self.pid = os.getpid()
+        self.counts = {}
+        self.logs = []
+        threading.Thread(target=self._run, name='download-recorder', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            self.wakeup.wait(app.config['DOWNLOAD_FLUSH_INTERVAL_MS'] / 1000 or None)
+            self.wakeup.clear()
+            self.flush()
+    
+    def flush(self):
+        """Write everything buffered so far in a single transaction"""
+        with self.flush_lock:
+            with self.lock:
+                counts, self.counts = self.counts, {}
+                logs, self.logs = self.logs, []
+            if not logs:
+                return
+            
+            last_accessed = {}
+            for file_id, download_date, _ in logs:
+                last_accessed[file_id] = max(download_date, last_accessed.get(file_id, ''))
+            
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(f'''
+                    UPDATE files 
+                    SET download_count = download_count + ?, last_accessed = ?, expires_at = datetime(?, ?),
+                        gdsf_priority = {GDSF_PRIORITY.format(downloads='download_count + ?', size='file_size')}
+                    WHERE id = ?
+                ''', [(count, last_accessed[file_id], last_accessed[file_id], retention_modifier(), count, file_id)
+                      for file_id, count in counts.items()])
+                # Files deleted while their downloads were buffered get no log rows
+                cursor.executemany('''
+                    INSERT INTO download_logs (file_id, download_date, ip_address)
+                    SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM files WHERE id = ?)
+                ''', [(file_id, download_date, ip_address, file_id) for file_id, download_date, ip_address in logs])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"ERROR flushing download counters, will retry: {str(e)}")
+                self._requeue(logs)
+                return
+            finally:
+                conn.close()
+            data_changed()
+    
+    def _requeue(self, logs):
+        # Put a failed batch back in front of whatever arrived meanwhile, dropping the oldest
+        # downloads beyond DOWNLOAD_BACKLOG_MAX_EVENTS so an unavailable database cannot make
+        # the buffer grow without bound
+        with self.lock:
+            pending = logs + self.logs
+            excess = len(pending) - DOWNLOAD_BACKLOG_MAX_EVENTS
+            if excess > 0:
+                self.dropped += excess
+                print(f"ERROR download backlog full, dropped {excess} oldest downloads ({self.dropped} so far)")
+                pending = pending[excess:]
+            self.logs = pending
+            self.counts = {}
+            for file_id, _, _ in pending:
+                self.counts[file_id] = self.counts.get(file_id, 0) + 1
+
+download_recorder = DownloadRecorder()
+atexit.register(download_recorder.flush)
+
+class WriteGeneration:
+    """Counter shared by every worker process, such as the number of committed writes.
+    
+    The counter is 8 bytes in a memory-mapped file, so reading it is a memory load with no system
+    call; bumping takes a file lock for the read-modify-write.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pid = None
+        self.fd = None
+        self.map = None
+    
+    def _open(self):
+        # Reopened after a fork: flock is per open file, so a shared descriptor would not exclude
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < 8:
+                    # Start a new counter at a random value so that ETags built from it never
+                    # repeat ones handed out before the file was removed
+                    os.ftruncate(fd, 8)
+                    os.pwrite(fd, struct.pack('<Q', int.from_bytes(os.urandom(6), 'little')), 0)
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self.fd, self.map, self.pid = fd, mmap.mmap(fd, 8), os.getpid()
+    
+    def current(self):
+        if self.pid != os.getpid():
+            self._open()
+        return struct.unpack_from('<Q', self.map)[0]
+    
+    def bump(self):
+        if self.pid != os.getpid():
+            self._open()
+        with self.lock:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                struct.pack_into('<Q', self.map, 0, struct.unpack_from('<Q', self.map)[0] + 1)
+            finally:
+                if fcntl:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+write_generation = WriteGeneration(GENERATION_FILE)
+sweep_requests = WriteGeneration(SWEEP_REQUEST_FILE)
+
+def data_changed():
+    """Call after committing a write to files: invalidates cached responses in every worker and
+    wakes this worker's change broadcaster"""
+    write_generation.bump()
+    change_broadcaster.notify()
+
+class ResponseCache:
+    """Per-worker cache of finished JSON responses, keyed by path and query string.
+    
+    Entries are tagged with the write generation they were built under and are only served while
+    it is still current and they are younger than RESPONSE_CACHE_TTL. Least recently used entries
+    are evicted beyond RESPONSE_CACHE_MAX_ENTRIES.
+    """
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == generation and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+    
+    def put(self, key, generation, response):
+        with self.lock:
+            self.entries[key] = (generation, time.monotonic() + app.config['RESPONSE_CACHE_TTL'], response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def metrics(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES)
+
+def not_modified(etag):
+    """A 304 response if the request's If-None-Match already names `etag`, else None"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def cached_response(view=None, *, daily=False):
+    """Serve a view's successful responses from response_cache until the data changes, with a
+    strong ETag derived from the write generation so unchanged data costs clients a 304.
+    
+    Views whose output also depends on the current date (files_today) pass daily=True.
+    """
+    if view is None:
+        return lambda view: cached_response(view, daily=daily)
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Read the generation before the data: a write committing meanwhile bumps it afterwards,
+        # so whatever we build here is never served past that write
+        generation = write_generation.current()
+        variant = datetime.datetime.now().date().isoformat() if daily else ''
+        etag = f'{generation}-{variant}' if daily else str(generation)
+        
+        response = not_modified(etag)
+        if response:
+            return response
+        
+        caching = app.config['RESPONSE_CACHE_TTL'] > 0
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), variant)
+        cached = response_cache.get(key, generation) if caching else None
+        if cached:
+            body, headers = cached
+            return app.response_class(body, headers=headers)
+        
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'  # Always revalidate, usually to a 304
+            if caching:
+                response_cache.put(key, generation, (response.get_data(), list(response.headers.items())))
+        return response
+    return wrapper
+
+def allowed_file(filename):
+    """Check if file extension is allowed - now allows all files"""
+    return True  # Allow all file types
+
+def hash_file(file_path):
+    """SHA-256 hex digest of a file on disk"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BUFFER_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def adopt_blob(cursor, incoming_path, digest, file_size):
+    """Take a reference on the blob for `digest`, moving `incoming_path` into place only if the
+    content is new. Must run inside a write transaction. Returns the blob's stored name."""
+    cursor.execute('''
+        INSERT OR IGNORE INTO blobs (digest, stored_name, file_size)
+        VALUES (?, ?, ?)
+    ''', (digest, digest, file_size))
+    created = cursor.rowcount == 1
+    
+    cursor.execute('SELECT stored_name FROM blobs WHERE digest = ?', (digest,))
+    stored_name = cursor.fetchone()['stored_name']
+    blob_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+    
+    if created or not os.path.exists(blob_path):
+        os.replace(incoming_path, blob_path)
+    else:
+        # Duplicate content: the new upload costs a metadata row only
+        os.remove(incoming_path)
+        print(f"Deduplicated upload against blob {digest}")
+    
+    cursor.execute('UPDATE blobs SET ref_count = ref_count + 1 WHERE digest = ?', (digest,))
+    return stored_name
+
+def discard_unreferenced_blob(conn, digest):
+    """Clean up after an adopt_blob whose transaction rolled back: the upload may already have
+    been moved into place as the blob, which no committed row now refers to"""
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,))
+    blob_path = os.path.join(app.config['UPLOAD_FOLDER'], digest)
+    if not cursor.fetchone() and os.path.exists(blob_path):
+        os.remove(blob_path)
+    conn.commit()
+
+def reference_blob(cursor, digest, file_size):
+    """Take another reference on already stored content. Must run inside a write transaction.
+    Returns the blob's stored name, or None if no blob with that digest and size is on disk."""
+    cursor.execute('SELECT stored_name, file_size FROM blobs WHERE digest = ?', (digest,))
+    blob = cursor.fetchone()
+    
+    if not blob or blob['file_size'] != file_size:
+        return None
+    if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], blob['stored_name'])):
+        return None
+    
+    cursor.execute('UPDATE blobs SET ref_count = ref_count + 1 WHERE digest = ?', (digest,))
+    return blob['stored_name']
+
+def release_file(cursor, file_row):
+    """Drop a files row's reference to its content, moving the physical file to the reclaim
+    folder once nothing refers to it. Must run inside a write transaction. Returns whether the
+    file was queued for reclamation."""
+    if file_row['sha256'] is not None:
+        cursor.execute('UPDATE blobs SET ref_count = ref_count - 1 WHERE digest = ?', (file_row['sha256'],))
+        cursor.execute('SELECT ref_count FROM blobs WHERE digest = ?', (file_row['sha256'],))
+        blob = cursor.fetchone()
+        if blob and blob['ref_count'] > 0:
+            return False
+        cursor.execute('DELETE FROM blobs WHERE digest = ?', (file_row['sha256'],))
+    
+    return trash_file(cursor, file_row['stored_name'])
+
+def trash_file(cursor, stored_name):
+    """First phase of deleting stored content: rename it into the reclaim folder and queue it.
+    Must run inside the write transaction that drops the last reference to it.
+    
+    The rename happens before the commit, so the name is free for new uploads the moment the
+    rows are gone. If the transaction rolls back or the process dies first, the entry is left
+    without a queue row and Reclaimer.recover moves it back; that runs at startup, before the
+    process serves anything, and on every pass of the elected reclaimer. Every caller takes the
+    write lock (BEGIN IMMEDIATE) before the rename, and recover takes it too, so it never sees
+    the entry of a delete that is still in flight.
+    """
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+    trash_name = f'{stored_name}.{uuid.uuid4().hex}'
+    try:
+        file_size = os.stat(file_path).st_size
+        os.replace(file_path, os.path.join(app.config['RECLAIM_FOLDER'], trash_name))
+    except FileNotFoundError:
+        return False
+    cursor.execute('''
+        INSERT INTO reclaim_queue (trash_name, stored_name, file_size)
+        VALUES (?, ?, ?)
+    ''', (trash_name, stored_name, file_size))
+    return True
+
+def remove_file_row(cursor, file_row):
+    """Delete a file's records, queueing its content for reclamation once no other upload
+    shares it. Must run inside a write transaction."""
+    release_file(cursor, file_row)
+    cursor.execute('DELETE FROM download_logs WHERE file_id = ?', (file_row['id'],))
+    cursor.execute('DELETE FROM files WHERE id = ?', (file_row['id'],))
+
+def cleanup_old_files(on_batch=None):
+    """Remove files whose expires_at has passed, one short write transaction per batch.
+    
+    expires_at is FILE_RETENTION after the last upload or download; the index on it hands each
+    batch the earliest due files first, so a sweep reads only what it removes. Each batch
+    removes at most RETENTION_BATCH_SIZE files and commits early once it has held the write lock
+    for RETENTION_BATCH_TIME, then pauses so request writers get in. on_batch, if given, is
+    called with the number of files each batch removed. Returns the total removed.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    removed = 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        while True:
+            cursor.execute('BEGIN IMMEDIATE')
+            deadline = time.monotonic() + RETENTION_BATCH_TIME
+            cursor.execute('''
+                SELECT id, stored_name, sha256 FROM files 
+                WHERE expires_at <= ?
+                ORDER BY expires_at
+                LIMIT ?
+            ''', (now, RETENTION_BATCH_SIZE))
+            old_files = cursor.fetchall()
+            
+            batch = 0
+            for file_row in old_files:
+                remove_file_row(cursor, file_row)
+                batch += 1
+                if time.monotonic() > deadline:
+                    break
+            conn.commit()
+            
+            if batch:
+                removed += batch
+                data_changed()
+                reclaimer.notify()
+                if on_batch:
+                    on_batch(batch)
+            if len(old_files) < RETENTION_BATCH_SIZE and batch == len(old_files):
+                break
+            time.sleep(RETENTION_BATCH_PAUSE)
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        cleanup_sessions_and_changes(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return removed
+
+def cleanup_sessions_and_changes(cursor):
+    """Housekeeping that rides along with each retention sweep. Must run inside a write
+    transaction."""
+    # Drop upload sessions that were abandoned before commit
+    session_cutoff = (datetime.datetime.now(datetime.timezone.utc) - UPLOAD_SESSION_TTL).strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('SELECT * FROM upload_sessions WHERE updated_at < ?', (session_cutoff,))
+    for session_row in cursor.fetchall():
+        drop_upload_session(cursor, session_row)
+    
+    # Keep the change log bounded; clients behind its start are told to reload
+    cursor.execute('''
+        DELETE FROM file_changes
+        WHERE seq <= (SELECT MAX(seq) FROM file_changes) - ?
+    ''', (CHANGE_LOG_MAX_ROWS,))
+
+# Eviction order per policy, each exactly the key of an index so a batch reads only the rows it
+# evicts. expires_at is the last access plus FILE_RETENTION, so its order is least recently used
+# first.
+EVICTION_ORDERS = {
+    'lru': 'expires_at',
+    'lfu': 'download_count, id',
+    'gdsf': 'gdsf_priority',
+}
+
+def evict_to_quota(on_batch=None):
+    """Quota mode: once the bytes on disk exceed STORAGE_QUOTA_BYTES, remove files in
+    EVICTION_POLICY order until the stored bytes are back under EVICTION_TARGET_RATIO of the
+    quota. Content already queued for reclamation counts towards the quota but not the target,
+    since it is on its way out; a file whose blob other files still share frees nothing, so
+    eviction carries on until the blob count has actually come down.
+    
+    Batches are bounded like retention batches. Under GDSF the clock advances to each evicted
+    file's priority, so files that have not been downloaded lately age out as well. Only one
+    evictor runs at a time across processes (the holder of the eviction lock); any other caller
+    returns at once, since that one is already bringing the total down. on_batch, if given, is
+    called with the number of files each batch evicted. Returns the total evicted.
+    """
+    quota = app.config['STORAGE_QUOTA_BYTES']
+    if not quota:
+        return 0
+    policy = app.config['EVICTION_POLICY']
+    order = EVICTION_ORDERS[policy]
+    target = quota * EVICTION_TARGET_RATIO
+    
+    evicted = 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Cheap check first: the rollup row is a primary-key read
+        cursor.execute('SELECT stored_bytes, reclaim_bytes FROM stats WHERE id = 1')
+        totals = cursor.fetchone()
+        if not totals or totals['stored_bytes'] + totals['reclaim_bytes'] <= quota:
+            return 0
+        
+        with file_lock('eviction', blocking=False) as held:
+            while held:
+                cursor.execute('BEGIN IMMEDIATE')
+                deadline = time.monotonic() + RETENTION_BATCH_TIME
+                cursor.execute('SELECT stored_bytes, gdsf_clock FROM stats WHERE id = 1')
+                stored_bytes, clock = cursor.fetchone()
+                if stored_bytes <= target:
+                    conn.commit()
+                    break
+                cursor.execute(f'''
+                    SELECT id, stored_name, sha256, file_size, gdsf_priority FROM files
+                    ORDER BY {order}
+                    LIMIT ?
+                ''', (RETENTION_BATCH_SIZE,))
+                
+                batch = 0
+                for file_row in cursor.fetchall():
+                    remove_file_row(cursor, file_row)
+                    batch += 1
+                    clock = max(clock, file_row['gdsf_priority'] or 0)
+                    # The triggers have counted whatever this freed
+                    cursor.execute('SELECT stored_bytes FROM stats WHERE id = 1')
+                    if cursor.fetchone()[0] <= target or time.monotonic() > deadline:
+                        break
+                if policy == 'gdsf':
+                    cursor.execute('UPDATE stats SET gdsf_clock = ? WHERE id = 1', (clock,))
+                conn.commit()
+                
+                if not batch:
+                    break
+                evicted += batch
+                data_changed()
+                reclaimer.notify()
+                if on_batch:
+                    on_batch(batch)
+                time.sleep(RETENTION_BATCH_PAUSE)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    
+    if evicted:
+        print(f"Quota eviction ({policy}) removed {evicted} files")
+    return evicted
+
+def enforce_quota():
+    """Evict down to the quota right after an upload commits, so the stored total goes back
+    under it with the upload instead of at the retention worker's next check. The upload has
+    committed by then, so a failure here is logged rather than failing the request."""
+    try:
+        evict_to_quota()
+    except Exception as e:
+        print(f"ERROR evicting to quota: {str(e)}")
+
+class RetentionWorker:
+    """Runs cleanup_old_files and, in quota mode, evict_to_quota in the background: when the
+    earliest expiry comes due, every QUOTA_CHECK_INTERVAL with a quota, and at least every
+    RETENTION_INTERVAL. Uploads evict for themselves through enforce_quota; the quota checks here
+    catch anything else that grows the total, like a change of quota.
+    
+    Every worker process starts one, but only the process holding the retention lock sweeps; the
+    others retry the lock every RETENTION_LEADER_RETRY and take over if the leader exits. Any
+    process can ask the leader for a sweep through request_sweep. Progress and throughput are
+    kept for /admin/metrics.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.leader = False
+        self.sweeping = False
+        self.sweeps = 0
+        self.removed_total = 0
+        self.evicted_total = 0
+        self.last_sweep = None
+    
+    def ensure_started(self):
+        if self.pid == os.getpid() or app.config['RETENTION_INTERVAL'] <= 0:
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.leader = False
+                threading.Thread(target=self._run, name='retention', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            with file_lock('retention', blocking=False) as leader:
+                if leader:
+                    self.leader = True
+                    print(f"Retention worker elected in process {os.getpid()}")
+                    while True:
+                        # Requests made from here on, even during the sweep, call for another
+                        requested = sweep_requests.current()
+                        try:
+                            self.sweep()
+                        except Exception as e:
+                            print(f"ERROR in retention sweep: {str(e)}")
+                        self._wait(requested, self._next_wait())
+            # Not the leader: check again shortly in case it went away
+            time.sleep(RETENTION_LEADER_RETRY)
+    
+    def _wait(self, requested, timeout):
+        """Sleep up to `timeout`, returning early when woken in this process or when any process
+        requests a sweep, i.e. sweep_requests moves on from `requested`"""
+        deadline = time.monotonic() + timeout
+        while sweep_requests.current() == requested:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.wakeup.wait(min(remaining, SWEEP_REQUEST_POLL)):
+                break
+        self.wakeup.clear()
+    
+    def _next_wait(self):
+        wait = self._next_expiry_wait()
+        if app.config['STORAGE_QUOTA_BYTES']:
+            wait = min(wait, QUOTA_CHECK_INTERVAL)
+        return wait
+    
+    def _next_expiry_wait(self):
+        # The lowest expires_at is one step down the index; sleep until it is due, without
+        # waking more often than RETENTION_MIN_WAIT however closely expiries follow each other
+        interval = app.config['RETENTION_INTERVAL']
+        try:
+            conn = db_pool.checkout()
+            next_expiry = conn.execute('SELECT MIN(expires_at) FROM files').fetchone()[0]
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"ERROR reading next expiry: {str(e)}")
+            return interval
+        if next_expiry is None:
+            return interval
+        due = datetime.datetime.strptime(next_expiry, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+        due_in = (due - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        return min(interval, max(due_in, RETENTION_MIN_WAIT))
+    
+    def request_sweep(self):
+        """Have a sweep run soon, without running it in the caller. The leader, in whichever
+        process, notices the request within SWEEP_REQUEST_POLL (at once in its own process).
+        With the background worker disabled, a one-off sweep runs in a new thread under the
+        retention lock instead."""
+        if app.config['RETENTION_INTERVAL'] <= 0:
+            def run():
+                with file_lock('retention'):
+                    try:
+                        self.sweep()
+                    except Exception as e:
+                        print(f"ERROR in retention sweep: {str(e)}")
+            
+            threading.Thread(target=run, name='retention-sweep', daemon=True).start()
+            return
+        
+        sweep_requests.bump()
+        if self.leader and self.pid == os.getpid():
+            self.wakeup.set()
+    
+    def sweep(self):
+        """Run one full sweep now, in the calling thread. Returns the number of files removed."""
+        progress = {'started': datetime.datetime.now().isoformat(), 'removed': 0, 'evicted': 0, 'batches': 0}
+        
+        def on_batch(count):
+            progress['removed'] += count
+            progress['batches'] += 1
+        
+        def on_evict(count):
+            progress['evicted'] += count
+            progress['batches'] += 1
+        
+        with self.lock:
+            self.sweeping = True
+            self.last_sweep = progress
+        start = time.monotonic()
+        try:
+            removed = cleanup_old_files(on_batch)
+            removed += evict_to_quota(on_evict)
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.sweeping = False
+                self.sweeps += 1
+                self.removed_total += progress['removed']
+                self.evicted_total += progress['evicted']
+                progress['seconds'] = round(elapsed, 3)
+                files = progress['removed'] + progress['evicted']
+                progress['files_per_second'] = round(files / elapsed, 1) if elapsed else 0.0
+        print(f"Retention sweep removed {removed} files in {elapsed:.2f}s")
+        return removed
+    
+    def metrics(self):
+        with self.lock:
+            return {
+                'leader': self.leader,
+                'sweeping': self.sweeping,
+                'sweeps': self.sweeps,
+                'removed_total': self.removed_total,
+                'evicted_total': self.evicted_total,
+                'quota_bytes': app.config['STORAGE_QUOTA_BYTES'],
+                'eviction_policy': app.config['EVICTION_POLICY'],
+                'last_sweep': dict(self.last_sweep) if self.last_sweep else None
+            }
+
+retention_worker = RetentionWorker()
+
+class Reclaimer:
+    """Second phase of deletion: unlinks what trash_file queued, in the background.
+    
+    Like the retention worker, one process at a time (the holder of the reclaim lock) does the
+    work. Unlinking is paced to RECLAIM_BYTES_PER_SECOND, and files larger than
+    RECLAIM_TRUNCATE_STEP are truncated down in steps first so no single call stalls the disk.
+    Each pass also settles crash debris (see recover), which every process does once at startup
+    as well, so a row is never left pointing at content stranded in the reclaim folder.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.leader = False
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+        self.restored_files = 0
+    
+    def notify(self):
+        """Tell the reclaimer a delete just committed"""
+        if app.config['RECLAIM_INTERVAL'] <= 0:
+            self.reclaim()
+        else:
+            self.wakeup.set()
+    
+    def ensure_started(self):
+        if self.pid == os.getpid() or app.config['RECLAIM_INTERVAL'] <= 0:
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.leader = False
+                threading.Thread(target=self._run, name='reclaimer', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            with file_lock('reclaim', blocking=False) as leader:
+                if leader:
+                    self.leader = True
+                    print(f"Reclaimer elected in process {os.getpid()}")
+                    while True:
+                        try:
+                            self.recover()
+                            self.reclaim()
+                        except Exception as e:
+                            print(f"ERROR reclaiming deleted files: {str(e)}")
+                        self.wakeup.wait(app.config['RECLAIM_INTERVAL'])
+                        self.wakeup.clear()
+            time.sleep(app.config['RECLAIM_INTERVAL'] or RECLAIM_INTERVAL)
+    
+    def reclaim(self):
+        """Unlink everything queued so far, oldest first. Returns the number of files reclaimed."""
+        conn = db_pool.checkout()
+        try:
+            reclaimed = 0
+            while True:
+                queued = conn.execute('''
+                    SELECT id, trash_name, file_size FROM reclaim_queue ORDER BY id LIMIT 100
+                ''').fetchall()
+                if not queued:
+                    return reclaimed
+                for entry in queued:
+                    self._unlink(os.path.join(app.config['RECLAIM_FOLDER'], entry['trash_name']))
+                    # The row goes after the file: a crash in between only repeats the unlink
+                    conn.execute('DELETE FROM reclaim_queue WHERE id = ?', (entry['id'],))
+                    conn.commit()
+                    reclaimed += 1
+                    with self.lock:
+                        self.reclaimed_files += 1
+                        self.reclaimed_bytes += entry['file_size']
+        finally:
+            conn.close()
+    
+    def _unlink(self, path):
+        try:
+            size = os.stat(path).st_size
+            while size > RECLAIM_TRUNCATE_STEP:
+                size -= RECLAIM_TRUNCATE_STEP
+                os.truncate(path, size)
+                self._pace(RECLAIM_TRUNCATE_STEP)
+            os.remove(path)
+            self._pace(size)
+        except FileNotFoundError:
+            pass
+    
+    def _pace(self, nbytes):
+        if app.config['RECLAIM_INTERVAL'] > 0 and RECLAIM_BYTES_PER_SECOND:
+            time.sleep(nbytes / RECLAIM_BYTES_PER_SECOND)
+    
+    def recover(self):
+        """Put back reclaim folder entries left by deletes that rolled back or crashed before
+        committing, and queue those nothing refers to any more. Holding the write lock, any entry
+        without a queue row is such debris. Returns the number of files put back."""
+        with os.scandir(app.config['RECLAIM_FOLDER']) as it:
+            if next(it, None) is None:
+                return 0
+        conn = db_pool.checkout()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT trash_name FROM reclaim_queue')
+            queued = {row['trash_name'] for row in cursor.fetchall()}
+            restored = 0
+            
+            for entry in os.scandir(app.config['RECLAIM_FOLDER']):
+                if entry.name in queued:
+                    continue
+                stored_name = entry.name.rsplit('.', 1)[0]
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+                cursor.execute('''
+                    SELECT EXISTS (SELECT 1 FROM files WHERE stored_name = ?)
+                        OR EXISTS (SELECT 1 FROM blobs WHERE digest = ?)
+                ''', (stored_name, stored_name))
+                if cursor.fetchone()[0] and not os.path.exists(file_path):
+                    os.replace(entry.path, file_path)
+                    print(f"Restored {stored_name} from the reclaim folder")
+                    restored += 1
+                    with self.lock:
+                        self.restored_files += 1
+                else:
+                    cursor.execute('''
+                        INSERT INTO reclaim_queue (trash_name, stored_name, file_size)
+                        VALUES (?, ?, ?)
+                    ''', (entry.name, stored_name, entry.stat().st_size))
+            conn.commit()
+            return restored
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def metrics(self):
+        conn = db_pool.checkout()
+        pending = conn.execute('SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM reclaim_queue').fetchone()
+        conn.close()
+        with self.lock:
+            return {
+                'leader': self.leader,
+                'pending_files': pending[0],
+                'pending_bytes': pending[1],
+                'reclaimed_files': self.reclaimed_files,
+                'reclaimed_bytes': self.reclaimed_bytes,
+                'restored_files': self.restored_files
+            }
+
+reclaimer = Reclaimer()
+
+def list_upload_folder(position):
+    """Upload folder names in directory order, from one scandir kept open for the whole run, so
+    a pass reads the folder once however many batches it takes. This touches no rows, so each
+    batch is read before its transaction starts. A resumed run skips forward past the name it
+    stopped at, once; if that name has gone meanwhile, the phase starts over from the top, which
+    only checks some files twice."""
+    folder = app.config['UPLOAD_FOLDER']
+    if position:
+        with os.scandir(folder) as it:
+            names = (entry.name for entry in it)
+            for name in names:
+                if name == position:
+                    yield from names
+                    return
+    with os.scandir(folder) as it:
+        for entry in it:
+            yield entry.name
+
+def scrub_upload_folder(cursor, names, repair, report):
+    """Check a batch of upload folder names from list_upload_folder against the database.
+    Files nothing refers to are orphans; with repair they are queued for reclamation."""
+    folder = app.config['UPLOAD_FOLDER']
+    # In-flight uploads and sessions write for a while before any row refers to their files
+    cutoff = time.time() - UPLOAD_SESSION_TTL.total_seconds()
+    for name in names:
+        file_path = os.path.join(folder, name)
+        try:
+            info = os.lstat(file_path)
+        except FileNotFoundError:
+            continue
+        if not S_ISREG(info.st_mode):
+            continue
+        report['scanned_files'] += 1
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM files WHERE stored_name = ?)
+                OR EXISTS (SELECT 1 FROM blobs WHERE digest = ?)
+        ''', (name, name))
+        if cursor.fetchone()[0]:
+            continue
+        cursor.execute('SELECT * FROM upload_sessions WHERE id = ?', (name.split('_', 1)[0],))
+        session = cursor.fetchone()
+        if session and session_file_path(session) == file_path:
+            continue
+        if info.st_mtime > cutoff:
+            continue
+        
+        report['orphan_files'] += 1
+        print(f"Orphan file in upload folder: {name}")
+        if repair and trash_file(cursor, name):
+            report['repaired'] += 1
+    
+    if len(names) < SCRUB_BATCH_SIZE:
+        return None
+    # Resume after a name that is still there, so that a later run can find its place
+    return next((name for name in reversed(names) if os.path.lexists(os.path.join(folder, name))), names[-1])
+
+def scrub_files(cursor, position, repair, report):
+    """Check the next batch of files rows. Rows whose content is missing from disk are
+    dangling; with repair they are deleted like an ordinary delete."""
+    cursor.execute('''
+        SELECT rowid, * FROM files
+        WHERE rowid > ?
+        ORDER BY rowid
+        LIMIT ?
+    ''', (int(position or 0), SCRUB_BATCH_SIZE))
+    rows = cursor.fetchall()
+    
+    for row in rows:
+        report['scanned_rows'] += 1
+        if row['expires_at'] is None:
+            report['missing_expiry'] += 1
+            if repair:
+                cursor.execute('''
+                    UPDATE files SET expires_at = datetime(COALESCE(last_accessed, upload_date, CURRENT_TIMESTAMP), ?)
+                    WHERE id = ?
+                ''', (retention_modifier(), row['id']))
+                report['repaired'] += 1
+        
+        if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], row['stored_name'])):
+            continue
+        report['dangling_rows'] += 1
+        print(f"File row without content on disk: {row['id']} ({row['original_name']})")
+        if repair:
+            remove_file_row(cursor, row)
+            report['repaired'] += 1
+    
+    return str(rows[-1]['rowid']) if len(rows) == SCRUB_BATCH_SIZE else None
+
+def scrub_blobs(cursor, position, repair, report):
+    """Check the next batch of blobs against the files rows that reference them"""
+    cursor.execute('''
+        SELECT digest, stored_name, ref_count FROM blobs
+        WHERE digest > ?
+        ORDER BY digest
+        LIMIT ?
+    ''', (position or '', SCRUB_BATCH_SIZE))
+    blobs = cursor.fetchall()
+    
+    for blob in blobs:
+        report['scanned_rows'] += 1
+        cursor.execute('SELECT COUNT(*) FROM files WHERE stored_name = ?', (blob['stored_name'],))
+        references = cursor.fetchone()[0]
+        if references == blob['ref_count']:
+            continue
+        
+        report['ref_count_mismatches'] += 1
+        print(f"Blob {blob['digest']} has ref_count {blob['ref_count']} but {references} references")
+        if repair:
+            if references:
+                cursor.execute('UPDATE blobs SET ref_count = ? WHERE digest = ?', (references, blob['digest']))
+            else:
+                cursor.execute('DELETE FROM blobs WHERE digest = ?', (blob['digest'],))
+                trash_file(cursor, blob['stored_name'])
+            report['repaired'] += 1
+    
+    return blobs[-1]['digest'] if len(blobs) == SCRUB_BATCH_SIZE else None
+
+def scrub_download_logs(cursor, position, repair, report):
+    """Check the next rowid range of download_logs for rows of files that no longer exist"""
+    low = int(position or 0)
+    high = low + SCRUB_BATCH_SIZE
+    orphans = '''
+        FROM download_logs
+        WHERE rowid > ? AND rowid <= ?
+          AND NOT EXISTS (SELECT 1 FROM files WHERE files.id = download_logs.file_id)
+    '''
+    cursor.execute('SELECT COUNT(*) ' + orphans, (low, high))
+    count = cursor.fetchone()[0]
+    report['orphan_logs'] += count
+    if repair and count:
+        cursor.execute('DELETE ' + orphans, (low, high))
+        report['repaired'] += count
+    
+    cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM download_logs')
+    return str(high) if high < cursor.fetchone()[0] else None
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+SCRUBBERS = {
+    'upload_folder': scrub_upload_folder,
+    'files': scrub_files,
+    'blobs': scrub_blobs,
+    'download_logs': scrub_download_logs,
+}
 
-def allowed_file(filename):
-    """Check if file extension is allowed - now allows all files"""
-    return True  # Allow all file types
+# Phases whose batches are drawn from a listing outside the database, opened once per run at the
+# saved position, before each batch transaction starts
+SCRUB_LISTINGS = {
+    'upload_folder': list_upload_folder,
+}
 
-def cleanup_old_files():
-    """Remove files older than 30 days"""
+def scrub(repair=False, max_batches=None, restart=False):
+    """Cross-check the upload folder and the database, a batch at a time.
+    
+    Phases run in SCRUB_PHASES order and each batch is one short transaction (a write
+    transaction when repairing), after which the resume point is saved in scrub_progress (in the
+    same transaction when repairing, in a short write transaction of its own otherwise), so an
+    interrupted or batch-limited run continues where it stopped next time. Returns the counts of
+    what was checked, found and repaired.
+    """
+    report = dict.fromkeys(['batches', 'scanned_files', 'scanned_rows', 'orphan_files', 'dangling_rows',
+                            'ref_count_mismatches', 'orphan_logs', 'missing_expiry', 'repaired'], 0)
     conn = get_db_connection()
     cursor = conn.cursor()
+    listings = {}
+    try:
+        if restart:
+            cursor.execute('DELETE FROM scrub_progress')
+            conn.commit()
+        cursor.execute('SELECT phase, position FROM scrub_progress WHERE id = 1')
+        progress = cursor.fetchone()
+        phase, position = (progress['phase'], progress['position']) if progress else (SCRUB_PHASES[0], '')
+        report['resumed_at'] = f'{phase} {position}'.strip()
+        
+        while max_batches is None or report['batches'] < max_batches:
+            if phase in SCRUB_LISTINGS:
+                if phase not in listings:
+                    listings[phase] = SCRUB_LISTINGS[phase](position)
+                batch = list(itertools.islice(listings[phase], SCRUB_BATCH_SIZE))
+            else:
+                batch = position
+            cursor.execute('BEGIN IMMEDIATE' if repair else 'BEGIN')
+            position = SCRUBBERS[phase](cursor, batch, repair, report)
+            if not repair:
+                # A read transaction can't upgrade once another writer has committed since it
+                # began, so the resume point is saved in a write transaction of its own
+                conn.commit()
+                cursor.execute('BEGIN IMMEDIATE')
+            finished = False
+            if position is None:
+                next_index = SCRUB_PHASES.index(phase) + 1
+                finished = next_index == len(SCRUB_PHASES)
+                phase, position = SCRUB_PHASES[0 if finished else next_index], ''
+            cursor.execute('''
+                INSERT INTO scrub_progress (id, phase, position, finished_at)
+                VALUES (1, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)
+                ON CONFLICT (id) DO UPDATE SET
+                    phase = excluded.phase,
+                    position = excluded.position,
+                    started_at = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE started_at END,
+                    finished_at = COALESCE(excluded.finished_at, finished_at)
+            ''', (phase, position, finished, finished))
+            conn.commit()
+            report['batches'] += 1
+            if finished:
+                report['finished'] = True
+                break
+            time.sleep(SCRUB_BATCH_PAUSE)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for listing in listings.values():
+            listing.close()
+        conn.close()
     
-    # Get files older than 30 days
-    thirty_days_ago = datetime.datetime.now() - datetime.timedelta(days=30)
-    cursor.execute('''
-        SELECT stored_name FROM files 
-        WHERE last_accessed < ? OR upload_date < ?
-    ''', (thirty_days_ago, thirty_days_ago))
+    if repair and report['repaired']:
+        data_changed()
+        reclaimer.notify()
+    return report
+
+@app.before_request
+def start_background_workers():
+    retention_worker.ensure_started()
+    reclaimer.ensure_started()
+
+def session_file_path(session):
+    """Path chunks of an upload session are written into before it joins the blob store"""
+    return os.path.join(app.config['UPLOAD_FOLDER'], session['id'] + '_' + session['original_name'])
+
+def remove_session_file(session):
+    """Remove the partially written file of an upload session, if any"""
+    file_path = session_file_path(session)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def drop_upload_session(cursor, session):
+    """Discard an upload session with its chunk records and partial file. Must run inside a
+    write transaction."""
+    remove_session_file(session)
+    cursor.execute('DELETE FROM upload_chunks WHERE session_id = ?', (session['id'],))
+    cursor.execute('DELETE FROM upload_sessions WHERE id = ?', (session['id'],))
+
+def preallocate_file(file_path, file_size):
+    """Create `file_path` with `file_size` bytes reserved so chunks can land in any order"""
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, file_size)
+                return
+            except OSError:
+                pass  # Filesystem without fallocate support, fall back to a sparse file
+        os.ftruncate(fd, file_size)
+    finally:
+        os.close(fd)
+
+def expected_chunk_size(session, chunk_index):
+    """Number of bytes chunk `chunk_index` must contain for `session`"""
+    offset = chunk_index * session['chunk_size']
+    return min(session['chunk_size'], session['file_size'] - offset)
+
+class IndexPage:
+    """The main page, compiled and rendered once and kept in memory in every encoding we serve.
     
-    old_files = cursor.fetchall()
+    The page carries no data of its own, so its ETag is a digest of the rendered HTML. In debug
+    mode or with TEMPLATES_AUTO_RELOAD the template file is checked on each request and
+    reloaded when it changes.
+    """
     
-    # Delete physical files
-    for file_row in old_files:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_row['stored_name'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.variants = {}
     
-    # Delete database records
-    cursor.execute('''
-        DELETE FROM files 
-        WHERE last_accessed < ? OR upload_date < ?
-    ''', (thirty_days_ago, thirty_days_ago))
+    def load(self):
+        with self.lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.mtime:
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                template = app.jinja_env.from_string(f.read())
+            with app.app_context():
+                context = {}
+                app.update_template_context(context)
+                body = template.render(context).encode('utf-8')
+            
+            digest = hashlib.sha256(body).hexdigest()[:32]
+            # Each encoding is a different representation, so each gets its own strong ETag
+            variants = {None: (body, digest), 'gzip': (gzip.compress(body, 9, mtime=0), f'{digest}.gz')}
+            if brotli:
+                variants['br'] = (brotli.compress(body, quality=11), f'{digest}.br')
+            self.variants, self.mtime = variants, mtime
+            print(f"Loaded {self.path}: {len(body)} bytes, {', '.join(f'{name} {len(data)}' for name, (data, _) in variants.items() if name)}")
     
-    conn.commit()
-    conn.close()
+    def response(self):
+        if app.debug or app.config['TEMPLATES_AUTO_RELOAD']:
+            self.load()
+        
+        encoding = next((name for name in ('br', 'gzip')
+                         if name in self.variants and request.accept_encodings[name]), None)
+        body, etag = self.variants[encoding]
+        response = not_modified(etag)
+        if not response:
+            response = app.response_class(body, mimetype='text/html')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+index_page = IndexPage('index.html')
 
 @app.route('/')
 def index():
     """Serve the main HTML page"""
-    with open('index.html', 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    return render_template_string(html_content)
+    return index_page.response()
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -124,37 +1883,48 @@ def upload_file():
         if file and allowed_file(file.filename):
             print("File validation passed")
             
-            # Generate unique filename
-            file_id = str(uuid.uuid4())
-            original_name = secure_filename(file.filename)
-            stored_name = file_id + '_' + original_name
-            
-            print(f"Generated filename: {stored_name}")
+            # The file was already streamed into the upload folder and hashed while the form was parsed
+            spool = file.stream
+            file_id = spool.file_id
+            original_name = spool.original_name
             
-            # Save file
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
-            print(f"Saving to: {file_path}")
+            print(f"Saved to: {spool.path}")
             
-            file.save(file_path)
-            print("File saved successfully")
+            # The spool is kept only once a row refers to it; until then a failure discards it
+            spool.flush()
             
             # Get file info
-            file_size = os.path.getsize(file_path)
-            mime_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+            file_size = spool.size
+            digest = spool.sha256.hexdigest()
+            mime_type = mimetypes.guess_type(original_name)[0] or 'application/octet-stream'
             
             print(f"File size: {file_size} bytes")
+            print(f"SHA-256: {digest}")
             print(f"MIME type: {mime_type}")
             
-            # Save to database
+            # Save to database, sharing the blob with earlier uploads of the same content
             conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO files (id, original_name, stored_name, file_size, mime_type, description, uploader)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (file_id, original_name, stored_name, file_size, mime_type, 
-                  request.form.get('description', ''), request.form.get('uploader', 'Anonymous')))
-            conn.commit()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                stored_name = adopt_blob(cursor, spool.path, digest, file_size)
+                cursor.execute(f'''
+                    INSERT INTO files (id, original_name, stored_name, file_size, mime_type, description, uploader, sha256,
+                                       expires_at, gdsf_priority)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', ?), {GDSF_PRIORITY.format(downloads='0', size='?')})
+                ''', (file_id, original_name, stored_name, file_size, mime_type, 
+                      request.form.get('description', ''), request.form.get('uploader', 'Anonymous'), digest,
+                      retention_modifier(), file_size))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                discard_unreferenced_blob(conn, digest)
+                raise
             conn.close()
+            spool.keep()
+            data_changed()
+            enforce_quota()
+            print("File saved successfully")
             
             print("Database record created successfully")
             print("=== UPLOAD COMPLETE ===")
@@ -173,9 +1943,455 @@ def upload_file():
         traceback.print_exc()
         return f"Upload error: {str(e)}", 500
 
+@app.route('/upload/skip', methods=['POST'])
+def skip_upload():
+    """Create a file from content the server already has, identified by its SHA-256, without any upload"""
+    data = request.get_json(silent=True) or {}
+    
+    digest = str(data.get('sha256') or '').lower()
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        return jsonify({'success': False, 'message': 'sha256 must be a hex SHA-256 digest'}), 400
+    
+    try:
+        file_size = int(data.get('file_size'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'file_size must be an integer'}), 400
+    
+    original_name = secure_filename(data.get('filename') or '')
+    if not original_name:
+        return jsonify({'success': False, 'message': 'filename is required'}), 400
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    stored_name = reference_blob(cursor, digest, file_size)
+    
+    if not stored_name:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'message': 'Content not stored yet, upload it'}), 404
+    
+    file_id = str(uuid.uuid4())
+    mime_type = mimetypes.guess_type(original_name)[0] or 'application/octet-stream'
+    cursor.execute(f'''
+        INSERT INTO files (id, original_name, stored_name, file_size, mime_type, description, uploader, sha256,
+                           expires_at, gdsf_priority)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', ?), {GDSF_PRIORITY.format(downloads='0', size='?')})
+    ''', (file_id, original_name, stored_name, file_size, mime_type,
+          data.get('description', ''), data.get('uploader') or 'Anonymous', digest, retention_modifier(), file_size))
+    conn.commit()
+    conn.close()
+    data_changed()
+    enforce_quota()
+    
+    print(f"Upload skipped, {original_name} shares blob {digest}")
+    return jsonify({'success': True, 'id': file_id}), 201
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    """Start a resumable chunked upload"""
+    data = request.get_json(silent=True) or {}
+    
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'success': False, 'message': 'filename is required'}), 400
+    
+    try:
+        file_size = int(data.get('file_size'))
+        chunk_size = int(data.get('chunk_size') or DEFAULT_CHUNK_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'file_size and chunk_size must be integers'}), 400
+    
+    if file_size <= 0:
+        return jsonify({'success': False, 'message': 'file_size must be positive'}), 400
+    if file_size > MAX_FILE_SIZE:
+        return jsonify({'success': False, 'message': 'File too large! Maximum file size is 1GB.'}), 413
+    if chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+        return jsonify({'success': False, 'message': f'chunk_size must be between 1 and {MAX_CHUNK_SIZE}'}), 400
+    
+    session_id = str(uuid.uuid4())
+    total_chunks = (file_size + chunk_size - 1) // chunk_size
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Every open session holds its whole file on disk until commit, so their total is capped
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('SELECT COALESCE(SUM(file_size), 0) FROM upload_sessions')
+    if cursor.fetchone()[0] + file_size > app.config['UPLOAD_SESSIONS_MAX_RESERVED']:
+        conn.rollback()
+        conn.close()
+        return jsonify({'success': False, 'message': 'Too many uploads in progress, try again later'}), 507
+    
+    cursor.execute('''
+        INSERT INTO upload_sessions (id, original_name, file_size, chunk_size, total_chunks, description, uploader)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (session_id, filename, file_size, chunk_size, total_chunks,
+          data.get('description', ''), data.get('uploader') or 'Anonymous'))
+    conn.commit()
+    
+    # Chunks are written at their offset straight into the final file, so commit never re-copies data
+    session = {'id': session_id, 'original_name': filename}
+    try:
+        preallocate_file(session_file_path(session), file_size)
+    except OSError as e:
+        print(f"ERROR preallocating upload session {session_id}: {str(e)}")
+        cursor.execute('BEGIN IMMEDIATE')
+        drop_upload_session(cursor, session)
+        conn.commit()
+        conn.close()
+        return jsonify({'success': False, 'message': 'Not enough disk space for this upload'}), 507
+    conn.close()
+    
+    print(f"Upload session created: {session_id} ({filename}, {total_chunks} chunks)")
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'chunk_size': chunk_size,
+        'total_chunks': total_chunks
+    }), 201
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+def upload_session_status(session_id):
+    """Report which chunks of an upload session have been received"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))
+    session = cursor.fetchone()
+    
+    if not session:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Upload session not found'}), 404
+    
+    cursor.execute('''
+        SELECT chunk_index FROM upload_chunks
+        WHERE session_id = ?
+        ORDER BY chunk_index
+    ''', (session_id,))
+    received = [row['chunk_index'] for row in cursor.fetchall()]
+    conn.close()
+    
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'file_size': session['file_size'],
+        'chunk_size': session['chunk_size'],
+        'total_chunks': session['total_chunks'],
+        'received': received
+    })
+
+@app.route('/upload/sessions/<session_id>/chunks/<int:chunk_index>', methods=['PUT'])
+def upload_chunk(session_id, chunk_index):
+    """Receive one chunk of a resumable upload; chunks may arrive concurrently, out of order or retried"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))
+    session = cursor.fetchone()
+    
+    if not session:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Upload session not found'}), 404
+    
+    if chunk_index >= session['total_chunks']:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Chunk index out of range'}), 416
+    
+    expected_size = expected_chunk_size(session, chunk_index)
+    if request.content_length != expected_size:
+        conn.close()
+        return jsonify({
+            'success': False,
+            'message': f'Chunk {chunk_index} must be exactly {expected_size} bytes'
+        }), 400
+    
+    # Stream the body straight to its offset in the target file; pwrite keeps concurrent chunks independent
+    offset = chunk_index * session['chunk_size']
+    written = 0
+    fd = os.open(session_file_path(session), os.O_WRONLY)
+    try:
+        while written < expected_size:
+            block = request.stream.read(min(STREAM_BUFFER_SIZE, expected_size - written))
+            if not block:
+                break
+            view = memoryview(block)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                view = view[count:]
+                written += count
+    finally:
+        os.close(fd)
+    
+    if written != expected_size:
+        conn.close()
+        print(f"Chunk {chunk_index} of {session_id} truncated: {written}/{expected_size} bytes")
+        return jsonify({'success': False, 'message': 'Chunk truncated, please retry'}), 400
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO upload_chunks (session_id, chunk_index, chunk_size)
+        VALUES (?, ?, ?)
+    ''', (session_id, chunk_index, written))
+    cursor.execute('''
+        UPDATE upload_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', (session_id,))
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'success': True, 'chunk_index': chunk_index, 'size': written})
+
+@app.route('/upload/sessions/<session_id>/commit', methods=['POST'])
+def commit_upload_session(session_id):
+    """Finish a chunked upload once every byte range has been received"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))
+        session = cursor.fetchone()
+        
+        if not session:
+            conn.close()
+            return jsonify({'success': False, 'message': 'Upload session not found'}), 404
+        
+        cursor.execute('''
+            SELECT chunk_index, chunk_size FROM upload_chunks
+            WHERE session_id = ?
+            ORDER BY chunk_index
+        ''', (session_id,))
+        received = {row['chunk_index']: row['chunk_size'] for row in cursor.fetchall()}
+        missing = [index for index in range(session['total_chunks'])
+                   if received.get(index) != expected_chunk_size(session, index)]
+        
+        if missing:
+            conn.close()
+            return jsonify({
+                'success': False,
+                'message': f"Upload incomplete: {len(missing)}/{session['total_chunks']} chunks missing",
+                'missing': missing
+            }), 409
+        
+        file_id = session_id
+        original_name = session['original_name']
+        file_path = session_file_path(session)
+        
+        # Make sure every range is on disk before the row pointing at it becomes visible
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        # Chunks may arrive in any order, so the digest is taken once the file is complete
+        digest = hash_file(file_path)
+        
+        # Take the write lock only now, and make sure a concurrent commit did not win the race
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT id FROM upload_sessions WHERE id = ?', (session_id,))
+        if not cursor.fetchone():
+            conn.rollback()
+            conn.close()
+            return jsonify({'success': False, 'message': 'Upload session not found'}), 404
+        
+        try:
+            stored_name = adopt_blob(cursor, file_path, digest, session['file_size'])
+            mime_type = mimetypes.guess_type(original_name)[0] or 'application/octet-stream'
+            
+            cursor.execute(f'''
+                INSERT INTO files (id, original_name, stored_name, file_size, mime_type, description, uploader, sha256,
+                                   expires_at, gdsf_priority)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', ?), {GDSF_PRIORITY.format(downloads='0', size='?')})
+            ''', (file_id, original_name, stored_name, session['file_size'], mime_type,
+                  session['description'], session['uploader'], digest, retention_modifier(), session['file_size']))
+            drop_upload_session(cursor, session)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            discard_unreferenced_blob(conn, digest)
+            # adopt_blob has already moved or removed the session's file, so the session
+            # cannot be committed again; drop it and let the client start over
+            cursor.execute('BEGIN IMMEDIATE')
+            drop_upload_session(cursor, session)
+            conn.commit()
+            conn.close()
+            raise
+        conn.close()
+        data_changed()
+        enforce_quota()
+        
+        print(f"Upload session committed: {session_id} -> {stored_name}")
+        return jsonify({'success': True, 'id': file_id})
+    
+    except Exception as e:
+        print(f"ERROR committing upload session: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Commit error: {str(e)}'}), 500
+
+@app.route('/upload/sessions/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """Abandon a chunked upload and discard its data"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM upload_sessions WHERE id = ?', (session_id,))
+    session = cursor.fetchone()
+    
+    if not session:
+        conn.close()
+        return jsonify({'success': False, 'message': 'Upload session not found'}), 404
+    
+    drop_upload_session(cursor, session)
+    conn.commit()
+    conn.close()
+    
+    return jsonify({'success': True, 'message': 'Upload session aborted'})
+
+def parse_byte_ranges(header):
+    """Parse a Range header into (first, last) pairs as written, last being None for open ranges and
+    first None for suffix ranges. Unlike Werkzeug's parser, overlapping and unordered ranges are kept."""
+    units, _, spec = (header or '').partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+    
+    ranges = []
+    for item in spec.split(','):
+        first, dash, last = item.strip().partition('-')
+        if not dash or not (first or last):
+            return None
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        first = int(first) if first else None
+        last = int(last) if last else None
+        if first is not None and last is not None and last < first:
+            return None
+        ranges.append((first, last))
+    return ranges
+
+def requested_ranges(file_size, etag, last_modified):
+    """Byte ranges the current request asks for, as sorted, merged (start, stop) pairs with stop
+    exclusive. None means the whole file should be sent, an empty list that no range is satisfiable."""
+    parsed = parse_byte_ranges(request.headers.get('Range'))
+    if parsed is None or len(parsed) > MAX_RANGES:
+        return None
+    
+    # If-Range: only honour the Range header while the client's copy is still current
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None and last_modified.replace(microsecond=0) > if_range.date:
+        return None
+    
+    ranges = []
+    for first, last in parsed:
+        if first is None:
+            # Suffix range: the final `last` bytes
+            start, stop = max(file_size - last, 0), file_size
+        else:
+            start, stop = first, file_size if last is None else min(last + 1, file_size)
+        if start < stop:
+            ranges.append((start, stop))
+    
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+def sendfile_socket(environ):
+    """Client socket the development server lets us write to directly, if zero-copy is enabled"""
+    if not app.config['DOWNLOAD_SENDFILE']:
+        return None
+    return environ.get('werkzeug.socket')
+
+def iter_file_parts(environ, file_path, parts, trailer=b''):
+    """Yield a response body made of (header, start, stop) parts of file_path followed by trailer.
+    
+    Under the development server the file bytes bypass Python entirely: each header is yielded
+    (the first yield makes the server flush the status line and headers) and the range is then
+    handed to socket.sendfile, which uses os.sendfile and falls back to plain sends where
+    sendfile is unavailable, e.g. on TLS sockets. Elsewhere the file is read in blocks.
+    """
+    sock = sendfile_socket(environ)
+    with open(file_path, 'rb') as f:
+        for header, start, stop in parts:
+            yield header
+            if sock is not None:
+                sock.sendfile(f, start, stop - start)
+                continue
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                block = f.read(min(STREAM_BUFFER_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+    if trailer:
+        yield trailer
+
+def file_range_body(environ, file_path, start, stop):
+    """Body for one contiguous range of file_path, zero-copy wherever the server supports it"""
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and app.config['DOWNLOAD_SENDFILE']:
+        # Servers such as gunicorn and uWSGI sendfile() a wrapped file from its current offset,
+        # stopping at Content-Length
+        f = open(file_path, 'rb')
+        f.seek(start)
+        return file_wrapper(f, STREAM_BUFFER_SIZE)
+    return iter_file_parts(environ, file_path, [(b'', start, stop)])
+
+def build_download_response(file_path, file_size, mime_type, ranges):
+    """Full (200), partial (206) or unsatisfiable (416) response for a stored file"""
+    environ = request.environ
+    
+    if ranges is None:
+        response = Response(file_range_body(environ, file_path, 0, file_size), 200, mimetype=mime_type,
+                            direct_passthrough=True)
+        response.content_length = file_size
+        return response
+    
+    if not ranges:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{file_size}'
+        return response
+    
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(file_range_body(environ, file_path, start, stop), 206, mimetype=mime_type,
+                            direct_passthrough=True)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{file_size}'
+        response.content_length = stop - start
+        return response
+    
+    boundary = uuid.uuid4().hex
+    parts = []
+    for index, (start, stop) in enumerate(ranges):
+        # Each part's leading CRLF closes the previous part's data
+        header = ('\r\n' if index else '') + (f'--{boundary}\r\n'
+                  f'Content-Type: {mime_type}\r\n'
+                  f'Content-Range: bytes {start}-{stop - 1}/{file_size}\r\n\r\n')
+        parts.append((header.encode('ascii'), start, stop))
+    trailer = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    content_length = len(trailer) + sum(len(header) + stop - start for header, start, stop in parts)
+    
+    response = Response(iter_file_parts(environ, file_path, parts, trailer), 206,
+                        content_type=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True)
+    response.content_length = content_length
+    return response
+
+def build_offload_response(stored_name, mime_type):
+    """Empty response telling the fronting proxy which blob to stream; it also handles any Range"""
+    response = Response(status=200, mimetype=mime_type)
+    response.automatically_set_content_length = False  # The proxy sets the real length
+    if app.config['DOWNLOAD_OFFLOAD'] == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], stored_name))
+    else:
+        response.headers['X-Accel-Redirect'] = app.config['DOWNLOAD_ACCEL_PREFIX'] + url_quote(stored_name)
+    return response
+
 @app.route('/download/<file_id>')
 def download_file(file_id):
-    """Handle file downloads"""
+    """Handle file downloads, including single and multi-range requests"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -187,28 +2403,49 @@ def download_file(file_id):
         conn.close()
         return "File not found!", 404
     
-    # Update download count and last accessed
-    cursor.execute('''
-        UPDATE files 
-        SET download_count = download_count + 1, last_accessed = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (file_id,))
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['stored_name'])
     
-    # Log download
-    cursor.execute('''
-        INSERT INTO download_logs (file_id, ip_address)
-        VALUES (?, ?)
-    ''', (file_id, request.remote_addr))
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        conn.close()
+        return "File not found on disk!", 404
+    
+    # Content-addressed files have a natural strong validator; legacy ones fall back to size and mtime
+    etag = file_info['sha256'] or f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    last_modified = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+    
+    # A client revalidating the copy it already has gets no body, and it is not another download
+    if request.if_none_match:
+        unchanged = request.if_none_match.contains(etag)
+    else:
+        unchanged = bool(request.if_modified_since) and last_modified.replace(microsecond=0) <= request.if_modified_since
+    if unchanged:
+        conn.close()
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+    
+    ranges = requested_ranges(stat.st_size, etag, last_modified)
     
-    conn.commit()
     conn.close()
     
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['stored_name'])
+    # Resumed or segmented transfers (ranges not starting at byte 0) are not new downloads.
+    # The count, last accessed time and log row are written behind, batched with other downloads.
+    if request.method == 'GET' and (ranges is None or (ranges and ranges[0][0] == 0)):
+        download_recorder.record(file_id, request.remote_addr)
     
-    if os.path.exists(file_path):
-        return send_file(file_path, as_attachment=True, download_name=file_info['original_name'])
+    mime_type = file_info['mime_type'] or 'application/octet-stream'
+    if app.config['DOWNLOAD_OFFLOAD']:
+        response = build_offload_response(file_info['stored_name'], mime_type)
     else:
-        return "File not found on disk!", 404
+        response = build_download_response(file_path, stat.st_size, mime_type, ranges)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Content-Disposition'] = f'attachment; filename="{file_info["original_name"]}"'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    return response
 
 @app.route('/delete/<file_id>', methods=['POST', 'DELETE'])
 def delete_file(file_id):
@@ -218,6 +2455,7 @@ def delete_file(file_id):
         
         conn = get_db_connection()
         cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
         
         # Get file info before deletion
         cursor.execute('SELECT * FROM files WHERE id = ?', (file_id,))
@@ -225,18 +2463,18 @@ def delete_file(file_id):
         
         if not file_info:
             print("File not found in database")
+            conn.rollback()
             conn.close()
             return jsonify({'success': False, 'message': 'File not found'}), 404
         
         print(f"Found file: {file_info['original_name']}")
         
-        # Delete physical file
+        # Queue the physical file for reclamation once no other upload shares its content
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_info['stored_name'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Physical file deleted: {file_path}")
+        if release_file(cursor, file_info):
+            print(f"Physical file moved to the reclaim folder: {file_path}")
         else:
-            print(f"Physical file not found: {file_path}")
+            print(f"Physical file kept or not found: {file_path}")
         
         # Delete from database
         cursor.execute('DELETE FROM download_logs WHERE file_id = ?', (file_id,))
@@ -244,6 +2482,8 @@ def delete_file(file_id):
         
         conn.commit()
         conn.close()
+        data_changed()
+        reclaimer.notify()
         
         print(f"File deleted successfully: {file_info['original_name']}")
         return jsonify({'success': True, 'message': 'File deleted successfully'})
@@ -254,57 +2494,405 @@ def delete_file(file_id):
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'Delete error: {str(e)}'}), 500
 
+def encode_cursor(values):
+    """Opaque pagination cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Values stored in a cursor made by encode_cursor, or None if it is not one"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+def parse_timestamp(value):
+    """Normalise an ISO date or datetime to the format upload_date is stored in"""
+    return datetime.datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def files_filter(args, sort):
+    """WHERE conditions and parameters for the /api/files filters in `args`, for a listing
+    ordered by `sort`"""
+    conditions = []
+    params = []
+    
+    # A range on any column but the sort column is applied while walking the sort index
+    # (the unary + keeps SQLite from using the range's own index and sorting every match)
+    def ranged(column):
+        return column if column == sort else '+' + column
+    
+    for column in ('uploader', 'mime_type'):
+        if args.get(column):
+            conditions.append(f'{column} = ?')
+            params.append(args[column])
+    if args.get('min_size'):
+        conditions.append(f"{ranged('file_size')} >= ?")
+        params.append(int(args['min_size']))
+    if args.get('max_size'):
+        conditions.append(f"{ranged('file_size')} <= ?")
+        params.append(int(args['max_size']))
+    if args.get('since'):
+        conditions.append(f"{ranged('upload_date')} >= ?")
+        params.append(parse_timestamp(args['since']))
+    if args.get('until'):
+        conditions.append(f"{ranged('upload_date')} < ?")
+        params.append(parse_timestamp(args['until']))
+    
+    return conditions, params
+
 @app.route('/api/files')
+@cached_response
 def api_files():
-    """API endpoint to get all files"""
+    """API endpoint to get files, one page at a time.
+    
+    Query parameters: limit, sort (upload_date, file_size, original_name, download_count), order
+    (asc or desc), filters (uploader, mime_type, min_size, max_size, since, until) and cursor. The
+    body is a JSON array; when more rows exist the X-Next-Cursor and Link headers point at them.
+    """
     try:
+        sort = request.args.get('sort', 'upload_date')
+        order = request.args.get('order', 'desc').lower()
+        if sort not in FILES_SORT_COLUMNS or order not in ('asc', 'desc'):
+            return jsonify({'success': False, 'message': 'Unsupported sort or order'}), 400
+        
+        try:
+            limit = min(int(request.args.get('limit', FILES_PAGE_SIZE)), MAX_FILES_PAGE_SIZE)
+            conditions, params = files_filter(request.args, sort)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Invalid limit or filter value'}), 400
+        if limit <= 0:
+            return jsonify({'success': False, 'message': 'limit must be positive'}), 400
+        
+        # Keyset pagination: continue strictly after the (sort value, id) the last page ended on
+        if request.args.get('cursor'):
+            position = decode_cursor(request.args['cursor'])
+            if position is None:
+                return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+            conditions.append(f"({sort}, id) {'<' if order == 'desc' else '>'} (?, ?)")
+            params.extend(position)
+        
+        where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, original_name, description, uploader, upload_date, file_size, download_count
+        cursor.execute(f'''
+            SELECT {FILE_LISTING_COLUMNS}
             FROM files 
-            ORDER BY upload_date DESC
-        ''')
+            {where}
+            ORDER BY {sort} {order.upper()}, id {order.upper()}
+            LIMIT ?
+        ''', params + [limit + 1])
         files = cursor.fetchall()
         conn.close()
         
-        return jsonify([dict(row) for row in files])
+        response = jsonify([dict(row) for row in files[:limit]])
+        if len(files) > limit:
+            last = files[limit - 1]
+            next_cursor = encode_cursor([last[sort], last['id']])
+            args = request.args.to_dict()
+            args['cursor'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("api_files", **args)}>; rel="next"'
+        return response
     except Exception as e:
         print(f"ERROR in api_files: {str(e)}")
         return jsonify([]), 500
 
-@app.route('/api/stats')
-def api_stats():
-    """API endpoint to get site statistics"""
+def iter_files_export(sql, params, as_ndjson):
+    """Stream the rows of `sql` as NDJSON lines or as one JSON array, a batch at a time"""
+    # The request's connection is released before the body is sent, so the stream brings its own
+    conn = db_pool.checkout()
     try:
-        print("=== STATS REQUEST ===")
-        conn = get_db_connection()
         cursor = conn.cursor()
+        cursor.execute(sql, params)
         
-        # Total files
-        cursor.execute('SELECT COUNT(*) as count FROM files')
-        total_files = cursor.fetchone()['count']
-        print(f"Total files: {total_files}")
+        if not as_ndjson:
+            yield b'['
+        first = True
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            if as_ndjson:
+                yield ''.join(json.dumps(dict(row)) + '\n' for row in rows).encode('utf-8')
+            else:
+                chunk = ','.join(json.dumps(dict(row)) for row in rows)
+                yield (chunk if first else ',' + chunk).encode('utf-8')
+                first = False
+        if not as_ndjson:
+            yield b']'
+    finally:
+        conn.close()
+
+@app.route('/api/files/export')
+def api_files_export():
+    """Stream the full file listing with constant memory, for sync jobs.
+    
+    Takes the same filters, sort and order as /api/files. format=ndjson (default) sends one JSON
+    object per line; format=json sends a single JSON array.
+    """
+    output_format = request.args.get('format', 'ndjson')
+    sort = request.args.get('sort', 'upload_date')
+    order = request.args.get('order', 'desc').lower()
+    if output_format not in ('ndjson', 'json'):
+        return jsonify({'success': False, 'message': 'format must be ndjson or json'}), 400
+    if sort not in FILES_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'success': False, 'message': 'Unsupported sort or order'}), 400
+    
+    try:
+        conditions, params = files_filter(request.args, sort)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid filter value'}), 400
+    
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    sql = f'''
+        SELECT {FILE_LISTING_COLUMNS}
+        FROM files 
+        {where}
+        ORDER BY {sort} {order.upper()}, id {order.upper()}
+    '''
+    
+    as_ndjson = output_format == 'ndjson'
+    return Response(iter_files_export(sql, params, as_ndjson),
+                    mimetype='application/x-ndjson' if as_ndjson else 'application/json')
+
+def collect_changes(cursor, since):
+    """Changes to the file list after sequence number `since`, as served by /api/changes"""
+    # Separate subqueries: SQLite only answers MIN and MAX from the index one at a time
+    cursor.execute('''
+        SELECT (SELECT COALESCE(MIN(seq), 1) FROM file_changes) AS first,
+               (SELECT COALESCE(MAX(seq), 0) FROM file_changes) AS last
+    ''')
+    bounds = cursor.fetchone()
+    
+    if since is None or since < bounds['first'] - 1 or since > bounds['last']:
+        return {'seq': bounds['last'], 'reset': True}
+    
+    cursor.execute('''
+        SELECT seq, file_id, op FROM file_changes
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (since, CHANGES_PAGE_SIZE))
+    changes = cursor.fetchall()
+    
+    # Collapse to one entry per file: new to the client if inserted within the window
+    inserted_ids = set()
+    changed_ids = []
+    for change in changes:
+        if change['op'] == 'insert':
+            inserted_ids.add(change['file_id'])
+        if change['file_id'] not in changed_ids:
+            changed_ids.append(change['file_id'])
+    
+    rows = {}
+    for start in range(0, len(changed_ids), 500):
+        batch = changed_ids[start:start + 500]
+        cursor.execute(f'''
+            SELECT {FILE_LISTING_COLUMNS} FROM files
+            WHERE id IN ({','.join('?' * len(batch))})
+        ''', batch)
+        rows.update((row['id'], dict(row)) for row in cursor.fetchall())
+    
+    return {
+        'seq': changes[-1]['seq'] if changes else since,
+        'reset': False,
+        'more': len(changes) == CHANGES_PAGE_SIZE,
+        'inserted': [rows[file_id] for file_id in changed_ids if file_id in rows and file_id in inserted_ids],
+        'updated': [rows[file_id] for file_id in changed_ids if file_id in rows and file_id not in inserted_ids],
+        'deleted': [file_id for file_id in changed_ids if file_id not in rows]
+    }
+
+@app.route('/api/changes')
+def api_changes():
+    """What changed in the file list since change sequence number `since`.
+    
+    Returns the sequence number to ask from next time and, per changed file, its current row
+    (inserted or updated) or its id (deleted). Without `since`, or when `since` is older than the
+    retained change log, `reset` is true and the client should reload /api/files instead.
+    """
+    try:
+        since = int(request.args['since'])
+    except (KeyError, ValueError):
+        since = None
+    
+    conn = get_db_connection()
+    result = collect_changes(conn.cursor(), since)
+    conn.close()
+    return jsonify(result)
+
+class ChangeBroadcaster:
+    """Fans file list changes out to this worker's Server-Sent Events subscribers.
+    
+    One thread per worker tails the shared change log (a single primary-key lookup per tick)
+    while anyone is subscribed, builds each event once and wakes every subscriber through a
+    shared condition. Writers in this worker call notify() to skip the wait; changes made by other
+    worker processes arrive through the database within SSE_POLL_INTERVAL.
+    """
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.wakeup = threading.Event()
+        self.pid = None
+        self.seq = 0
+        self.subscribers = 0
+        self.events = deque(maxlen=SSE_EVENT_BACKLOG)
+    
+    def notify(self):
+        """Tell the broadcaster the change log just grew"""
+        self.wakeup.set()
+    
+    def subscribe(self):
+        """Register a subscriber; returns the sequence number it is current as of, or None when
+        this worker already has SSE_MAX_SUBSCRIBERS"""
+        with self.condition:
+            if self.pid != os.getpid():
+                self._start()
+            if self.subscribers >= app.config['SSE_MAX_SUBSCRIBERS']:
+                return None
+            self.subscribers += 1
+            return self.seq
+    
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+    
+    def wait(self, seq, timeout):
+        """Events after `seq`, waiting up to `timeout` for one. None means the subscriber fell
+        too far behind the backlog and must reset."""
+        with self.condition:
+            if self.seq == seq:
+                self.condition.wait(timeout)
+            if self.seq == seq:
+                return []
+            events = [event for event in self.events if event[0] >= seq]
+            if not events or events[0][0] != seq:
+                return None
+            return events
+    
+    def _start(self):
+        # Called with the condition held, in a fresh or newly forked worker
+        self.pid = os.getpid()
+        self.events.clear()
+        conn = db_pool.checkout()
+        self.seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM file_changes').fetchone()[0]
+        conn.close()
+        threading.Thread(target=self._run, name='change-broadcaster', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            self.wakeup.wait(SSE_POLL_INTERVAL)
+            self.wakeup.clear()
+            if not self.subscribers:
+                continue
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"ERROR broadcasting changes: {str(e)}")
+    
+    def _poll(self):
+        conn = db_pool.checkout()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM file_changes')
+            if cursor.fetchone()[0] == self.seq:
+                return
+            
+            delta = collect_changes(cursor, self.seq)
+            delta['stats'] = collect_stats(cursor)
+        finally:
+            conn.close()
         
-        # Total storage used
-        cursor.execute('SELECT SUM(file_size) as size FROM files')
-        total_size_result = cursor.fetchone()
-        total_size = total_size_result['size'] or 0
-        print(f"Total size: {total_size}")
+        with self.condition:
+            self.events.append((self.seq, delta['seq'], json.dumps(delta)))
+            self.seq = delta['seq']
+            self.condition.notify_all()
+        if delta.get('more'):
+            self.wakeup.set()
+
+change_broadcaster = ChangeBroadcaster()
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events stream of file list changes and statistics.
+    
+    Each `changes` event carries the same payload as /api/changes plus current stats, and its id
+    is the change sequence number, so a reconnecting EventSource resumes from Last-Event-ID.
+    Pass `since` on the first connection to catch up from an earlier /api/changes sequence.
+    
+    Each open stream holds one request thread of a threaded server until the client goes away,
+    so streams are only served when SSE_ENABLED is set (404 otherwise), and a worker serves at
+    most SSE_MAX_SUBSCRIBERS of them and answers 503 beyond that; size the server's thread count
+    above it.
+    """
+    if not app.config['SSE_ENABLED']:
+        return jsonify({'success': False, 'message': 'Event streams are disabled, poll /api/changes instead'}), 404
+    
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args['since'])
+    except (KeyError, ValueError):
+        since = None
+    
+    def stream(seq, since):
+        yield f'retry: {SSE_HEARTBEAT_INTERVAL * 1000}\n\n'
         
-        # Files uploaded today
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT COUNT(*) as count FROM files WHERE DATE(upload_date) = ?', (today,))
-        files_today = cursor.fetchone()['count']
-        print(f"Files today: {files_today}")
+        # Catch up a subscriber that connects behind the broadcaster, once, on its own
+        if since is not None and since != seq:
+            conn = db_pool.checkout()
+            cursor = conn.cursor()
+            delta = collect_changes(cursor, since)
+            delta['stats'] = collect_stats(cursor)
+            conn.close()
+            if not delta['reset']:
+                seq = delta['seq']
+            yield f"id: {seq}\nevent: changes\ndata: {json.dumps(delta)}\n\n"
         
+        while True:
+            events = change_broadcaster.wait(seq, SSE_HEARTBEAT_INTERVAL)
+            if events is None:
+                seq = change_broadcaster.seq
+                yield f"id: {seq}\nevent: changes\ndata: {json.dumps({'seq': seq, 'reset': True})}\n\n"
+            elif not events:
+                yield ': keep-alive\n\n'
+            for _, seq, payload in events or ():
+                yield f'id: {seq}\nevent: changes\ndata: {payload}\n\n'
+    
+    seq = change_broadcaster.subscribe()
+    if seq is None:
+        return jsonify({'success': False, 'message': 'Too many open event streams, poll /api/changes instead'}), \
+            503, {'Retry-After': str(SSE_HEARTBEAT_INTERVAL)}
+    
+    response = Response(stream(seq, since), mimetype='text/event-stream')
+    # Runs however the response ends, even when its body is never iterated (HEAD)
+    response.call_on_close(change_broadcaster.unsubscribe)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Let nginx pass events through immediately
+    return response
+
+def collect_stats(cursor):
+    """Site statistics as served by /api/stats, read from the trigger-maintained rollups"""
+    # Total files and storage used
+    cursor.execute('SELECT total_files, total_size FROM stats WHERE id = 1')
+    totals = cursor.fetchone()
+    
+    # Files uploaded today
+    cursor.execute('SELECT files FROM daily_uploads WHERE day = ?', (datetime.datetime.now().date().isoformat(),))
+    today = cursor.fetchone()
+    
+    return {
+        'total_files': totals['total_files'] if totals else 0,
+        'total_size': totals['total_size'] if totals else 0,
+        'files_today': today['files'] if today else 0
+    }
+
+@app.route('/api/stats')
+@cached_response(daily=True)
+def api_stats():
+    """API endpoint to get site statistics"""
+    try:
+        print("=== STATS REQUEST ===")
+        conn = get_db_connection()
+        result = collect_stats(conn.cursor())
         conn.close()
-        
-        result = {
-            'total_files': total_files,
-            'total_size': total_size,
-            'files_today': files_today
-        }
         print(f"Stats result: {result}")
         
         return jsonify(result)
@@ -319,11 +2907,53 @@ def api_stats():
             'files_today': 0
         }), 500
 
-@app.route('/admin/cleanup')
+@app.route('/admin/cleanup', methods=['GET', 'POST'])
 def admin_cleanup():
     """Admin endpoint to manually trigger cleanup"""
-    cleanup_old_files()
-    return "Cleanup completed!"
+    # The retention leader sweeps in the background, whichever process it runs in; progress is
+    # in its /admin/metrics
+    retention_worker.request_sweep()
+    return "Cleanup requested!", 202
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Cache, retention and reclaim counters for this worker process"""
+    return jsonify({
+        'pid': os.getpid(),
+        'write_generation': write_generation.current(),
+        'response_cache': response_cache.metrics(),
+        'retention': retention_worker.metrics(),
+        'reclaim': reclaimer.metrics()
+    })
+
+@app.cli.command('scrub')
+@click.option('--repair', is_flag=True, help='Fix what is found instead of only reporting it.')
+@click.option('--batches', type=int, default=None, help='Stop after this many batches; the next run resumes.')
+@click.option('--restart', is_flag=True, help='Forget the saved resume point and start a new pass.')
+def scrub_command(repair, batches, restart):
+    """Find and optionally repair drift between the upload folder and the database"""
+    report = scrub(repair=repair, max_batches=batches, restart=restart)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if not report.get('finished'):
+        print("Pass not finished; run again to continue")
+
+@app.cli.command('reconcile-stats')
+@click.option('--repair', is_flag=True, help='Rewrite the rollups from the recomputed values.')
+def reconcile_stats_command(repair):
+    """Recompute the /api/stats rollups from scratch and report drift"""
+    conn = db_pool.checkout()
+    drift = reconcile_stats(conn, repair=repair)
+    conn.close()
+    
+    for key, stored, actual in drift:
+        print(f"{key}: stored {stored}, actual {actual}")
+    if not drift:
+        print("Stats rollups match the files table")
+    elif repair:
+        print(f"Repaired {len(drift)} drifted values")
+    else:
+        print(f"{len(drift)} drifted values; run with --repair to fix")
 
 @app.errorhandler(413)
 def too_large(e):
@@ -337,13 +2967,13 @@ def not_found(e):
 def server_error(e):
     return "Internal server error!", 500
 
+# Initialize and migrate the database as soon as the app is loaded, under any WSGI server
+init_database()
+# Settle deletes a previous run left half done before anything is served
+reclaimer.recover()
+index_page.load()
+
 if __name__ == '__main__':
-    # Initialize database on startup
-    init_database()
-    
-    # Run cleanup on startup
-    cleanup_old_files()
-    
     print("🚀 SimpleShare File Sharing Server Starting...")
     print("📁 Upload folder:", UPLOAD_FOLDER)
     print("💾 Database:", DATABASE)
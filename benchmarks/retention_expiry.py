@@ -0,0 +1,127 @@
+"""Benchmark the retention sweep against the full-table OR scan it replaced.
+
+Builds a scratch database through app.py's own migrations, fills it with ROWS files of which
+DUE have passed their expires_at, then times the sweep's expires_at range read, the old
+'last_accessed < ? OR upload_date < ?' read (with the last_accessed index it used put back),
+and one full cleanup_old_files() sweep. Run from the repository root:
+
+    python benchmarks/retention_expiry.py --rows 5000000 > bench_output.txt
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py opens fileshare.db, uploads/ and index.html relative to the working directory at import time
+WORKDIR = tempfile.mkdtemp(prefix='fileshare-bench-')
+shutil.copy(os.path.join(ROOT, 'index.html'), WORKDIR)
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
+
+import app as fileshare  # noqa: E402
+
+SWEEP_QUERY = '''
+    SELECT id, stored_name, sha256 FROM files
+    WHERE expires_at <= ?
+    ORDER BY expires_at
+    LIMIT ?
+'''
+
+OLD_QUERY = '''
+    SELECT id, stored_name FROM files
+    WHERE last_accessed < ? OR upload_date < ?
+'''
+
+
+def populate(conn, rows, due):
+    """Insert rows files, the first due of them already expired and the rest spread over the
+    coming FILE_RETENTION, with upload_date and last_accessed consistent with expires_at"""
+    retention = int(fileshare.FILE_RETENTION.total_seconds())
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?),
+        t(i, expires) AS (
+            SELECT i, datetime('now', (CASE WHEN i <= ? THEN -i ELSE i % ? + 60 END) || ' seconds')
+            FROM n
+        )
+        INSERT INTO files (id, original_name, stored_name, file_size, mime_type,
+                           upload_date, last_accessed, expires_at)
+        SELECT printf('%032x', i), 'file' || i || '.bin', printf('%032x', i), 1024,
+               'application/octet-stream', datetime(expires, ?), datetime(expires, ?), expires
+        FROM t
+    ''', (rows, due, retention, f'-{retention} seconds', f'-{retention} seconds'))
+    # A live change log never holds more than CHANGE_LOG_MAX_ROWS past a sweep; left at one row
+    # per insert, the sweep's housekeeping would spend its time trimming it instead
+    conn.execute('DELETE FROM file_changes')
+    conn.commit()
+
+
+def timed(conn, query, params, repeat):
+    """Best wall time of repeat runs, in milliseconds, and the number of rows returned"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(conn.execute(query, params).fetchall())
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def explain(conn, query, params):
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params):
+        print(f'    {row[3]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000, help='files in the table')
+    parser.add_argument('--due', type=int, default=fileshare.RETENTION_BATCH_SIZE,
+                        help='files already past their expires_at')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query, best one reported')
+    args = parser.parse_args()
+    
+    conn = fileshare.db_pool.checkout()
+    print(f'Populating {args.rows} files, {args.due} due...')
+    start = time.perf_counter()
+    populate(conn, args.rows, args.due)
+    print(f'  done in {time.perf_counter() - start:.1f} s')
+    
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    cutoff = (now - fileshare.FILE_RETENTION).strftime('%Y-%m-%d %H:%M:%S')
+    sweep_params = (stamp, fileshare.RETENTION_BATCH_SIZE)
+    old_params = (cutoff, cutoff)
+    
+    # The old sweep's plan relied on this index, which migration 6 dropped
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_last_accessed ON files (last_accessed)')
+    conn.execute('ANALYZE')
+    conn.commit()
+    
+    elapsed, count = timed(conn, SWEEP_QUERY, sweep_params, args.repeat)
+    print(f'\nexpires_at range read: {elapsed:.2f} ms, {count} rows')
+    explain(conn, SWEEP_QUERY, sweep_params)
+    
+    elapsed, count = timed(conn, OLD_QUERY, old_params, args.repeat)
+    print(f'\nOld OR read: {elapsed:.2f} ms, {count} rows')
+    explain(conn, OLD_QUERY, old_params)
+    
+    conn.execute('DROP INDEX idx_files_last_accessed')
+    conn.commit()
+    conn.close()
+    
+    batches = []
+    start = time.perf_counter()
+    removed = fileshare.cleanup_old_files(batches.append)
+    print(f'\nFull sweep: {(time.perf_counter() - start) * 1000:.2f} ms, {removed} files removed '
+          f'in {len(batches)} batches')
+    
+    shutil.rmtree(WORKDIR)
+
+
+if __name__ == '__main__':
+    main()
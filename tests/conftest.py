@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py keeps fileshare.db and uploads/ relative to the working directory and opens them at
+# import time, so the suite runs it from a scratch directory of its own
+WORKDIR = tempfile.mkdtemp(prefix='fileshare-tests-')
+shutil.copy(os.path.join(ROOT, 'index.html'), WORKDIR)
+os.chdir(WORKDIR)
+sys.path.insert(0, ROOT)
+
+import app as fileshare  # noqa: E402
+
+# Deleted in this order; files first so its triggers run before the tables they feed are cleared
+TABLES = ('files', 'blobs', 'download_logs', 'upload_chunks', 'upload_sessions', 'daily_uploads',
+          'reclaim_queue', 'scrub_progress')
+
+
+def clear_folder(folder):
+    for entry in os.scandir(folder):
+        if entry.is_file():
+            os.remove(entry.path)
+
+
+@pytest.fixture
+def app():
+    """The application with an empty store and its background workers run inline"""
+    fileshare.app.config.update(
+        TESTING=True,
+        RETENTION_INTERVAL=0,
+        RECLAIM_INTERVAL=0,
+        DOWNLOAD_FLUSH_INTERVAL_MS=0,
+        DOWNLOAD_OFFLOAD=None,
+        DOWNLOAD_SENDFILE=True,
+        RESPONSE_CACHE_TTL=30,
+        STORAGE_QUOTA_BYTES=None,
+        EVICTION_POLICY='lru',
+        SSE_ENABLED=fileshare.SSE_ENABLED,
+        SSE_MAX_SUBSCRIBERS=fileshare.SSE_MAX_SUBSCRIBERS,
+        UPLOAD_SESSIONS_MAX_RESERVED=fileshare.UPLOAD_SESSIONS_MAX_RESERVED,
+    )
+    conn = fileshare.db_pool.checkout()
+    for table in TABLES:
+        conn.execute(f'DELETE FROM {table}')
+    # Trim the change log to its latest entry, as retention would, so its position carries on
+    conn.execute('DELETE FROM file_changes WHERE seq < (SELECT MAX(seq) FROM file_changes)')
+    conn.execute('UPDATE stats SET total_files = 0, total_size = 0, gdsf_clock = 0, stored_bytes = 0, reclaim_bytes = 0')
+    conn.commit()
+    last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM file_changes').fetchone()[0]
+    conn.close()
+    clear_folder(fileshare.app.config['UPLOAD_FOLDER'])
+    clear_folder(fileshare.app.config['RECLAIM_FOLDER'])
+    fileshare.response_cache.entries.clear()
+    fileshare.write_generation.bump()
+    with fileshare.change_broadcaster.condition:
+        fileshare.change_broadcaster.seq = last_seq
+        fileshare.change_broadcaster.events.clear()
+    return fileshare.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    """A separate connection to the test database, as another process would see it"""
+    conn = sqlite3.connect(fileshare.DATABASE)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def upload(client, db):
+    """Upload `content` through the /upload form and return the new file's row"""
+    def upload(content, name='file.txt', **form):
+        response = client.post('/upload', data=dict(form, file=(io.BytesIO(content), name)),
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+        return db.execute('SELECT * FROM files ORDER BY rowid DESC LIMIT 1').fetchone()
+    return upload
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import app as fileshare
+
+
+@pytest.fixture
+def listing(upload):
+    """Five files of distinct sizes from two uploaders, returned in upload order"""
+    return [upload(b'x' * size, f'{name}.txt', uploader=uploader)
+            for name, size, uploader in [('e', 30, 'alice'), ('a', 10, 'bob'), ('d', 50, 'alice'),
+                                         ('b', 20, 'bob'), ('c', 40, 'alice')]]
+
+
+def all_pages(client, url):
+    """Follow the Link headers from url, returning each page's names"""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([row['original_name'] for row in response.json])
+        link = response.headers.get('Link')
+        url = link[1:link.index('>')] if link else None
+    return pages
+
+
+def test_pages_follow_the_cursor_without_gaps(client, listing):
+    pages = all_pages(client, '/api/files?sort=original_name&order=asc&limit=2')
+
+    assert pages == [['a.txt', 'b.txt'], ['c.txt', 'd.txt'], ['e.txt']]
+
+
+def test_rows_inserted_while_paging_do_not_shift_pages(client, upload, listing):
+    first = client.get('/api/files?sort=original_name&order=asc&limit=2')
+    upload(b'new', '0-first.txt')
+
+    rest = client.get('/api/files?sort=original_name&order=asc&limit=2&cursor=' + first.headers['X-Next-Cursor'])
+
+    assert [row['original_name'] for row in rest.json] == ['c.txt', 'd.txt']
+
+
+def test_filters_combine_with_sorting(client, listing):
+    pages = all_pages(client, '/api/files?uploader=alice&min_size=35&sort=file_size&order=desc&limit=1')
+
+    assert pages == [['d.txt'], ['c.txt']]
+
+
+def test_ties_in_the_sort_column_are_broken_by_id(client, upload):
+    for index in range(5):
+        upload(b'same', f'{index}.txt')
+
+    pages = all_pages(client, '/api/files?sort=file_size&limit=2')
+
+    assert sorted(sum(pages, [])) == [f'{index}.txt' for index in range(5)]
+
+
+@pytest.mark.parametrize('query', ['sort=password', 'order=sideways', 'limit=0', 'limit=many',
+                                   'min_size=big', 'cursor=garbage'])
+def test_invalid_parameters_are_refused(client, query):
+    assert client.get(f'/api/files?{query}').status_code == 400
+
+
+def test_export_streams_every_row_as_ndjson(client, listing, monkeypatch):
+    monkeypatch.setattr(fileshare, 'EXPORT_BATCH_SIZE', 2)
+
+    response = client.get('/api/files/export?sort=original_name&order=asc')
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['original_name'] for row in rows] == ['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt']
+
+
+def test_export_as_one_json_array_with_filters(client, listing, monkeypatch):
+    monkeypatch.setattr(fileshare, 'EXPORT_BATCH_SIZE', 2)
+
+    response = client.get('/api/files/export?format=json&uploader=bob&sort=file_size')
+
+    assert response.mimetype == 'application/json'
+    assert [row['original_name'] for row in json.loads(response.get_data())] == ['b.txt', 'a.txt']
+
+
+def test_empty_export_is_valid_json(client):
+    assert json.loads(client.get('/api/files/export?format=json').get_data()) == []
+    assert client.get('/api/files/export').get_data() == b''
+
+
+def test_export_refuses_unknown_formats(client):
+    assert client.get('/api/files/export?format=xml').status_code == 400
@@ -0,0 +1,67 @@
+import app as fileshare
+
+
+def changes(client, since=None):
+    response = client.get('/api/changes' if since is None else f'/api/changes?since={since}')
+    assert response.status_code == 200
+    return response.json
+
+
+def test_without_since_the_client_is_told_to_reload(client):
+    delta = changes(client)
+
+    assert delta['reset'] is True
+    assert isinstance(delta['seq'], int)
+
+
+def test_inserts_updates_and_deletes_since_a_sequence(client, upload):
+    kept = upload(b'kept', 'kept.txt')
+    doomed = upload(b'doomed', 'doomed.txt')
+    seq = changes(client)['seq']
+
+    added = upload(b'added', 'added.txt')
+    client.get(f"/download/{kept['id']}")
+    client.post(f"/delete/{doomed['id']}")
+    delta = changes(client, seq)
+
+    assert delta['reset'] is False
+    assert [row['id'] for row in delta['inserted']] == [added['id']]
+    assert [(row['id'], row['download_count']) for row in delta['updated']] == [(kept['id'], 1)]
+    assert delta['deleted'] == [doomed['id']]
+    assert changes(client, delta['seq']) == {'seq': delta['seq'], 'reset': False, 'more': False,
+                                             'inserted': [], 'updated': [], 'deleted': []}
+
+
+def test_file_added_and_removed_within_the_window_is_only_deleted(client, upload):
+    seq = changes(client)['seq']
+    brief = upload(b'brief', 'brief.txt')
+    client.post(f"/delete/{brief['id']}")
+
+    delta = changes(client, seq)
+
+    assert delta['inserted'] == []
+    assert delta['deleted'] == [brief['id']]
+
+
+def test_long_deltas_come_in_pages(client, upload, monkeypatch):
+    monkeypatch.setattr(fileshare, 'CHANGES_PAGE_SIZE', 2)
+    seq = changes(client)['seq']
+    for index in range(3):
+        upload(f'{index}'.encode(), f'{index}.txt')
+
+    first = changes(client, seq)
+    second = changes(client, first['seq'])
+
+    assert first['more'] is True and len(first['inserted']) == 2
+    assert second['more'] is False and len(second['inserted']) == 1
+
+
+def test_clients_behind_the_trimmed_log_are_reset(client, upload, monkeypatch):
+    seq = changes(client)['seq']
+    for index in range(3):
+        upload(f'{index}'.encode(), f'{index}.txt')
+    monkeypatch.setattr(fileshare, 'CHANGE_LOG_MAX_ROWS', 1)
+    fileshare.cleanup_old_files()
+
+    assert changes(client, seq)['reset'] is True
+    assert changes(client, seq + 3)['reset'] is False
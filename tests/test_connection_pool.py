@@ -0,0 +1,56 @@
+import app as fileshare
+
+
+def test_connections_are_reused(app):
+    pool = fileshare.ConnectionPool(fileshare.DATABASE, max_idle=2)
+
+    first = pool.checkout()
+    first.close()
+    second = pool.checkout()
+
+    assert second is first
+    second.close()
+
+
+def test_idle_connections_are_capped(app):
+    pool = fileshare.ConnectionPool(fileshare.DATABASE, max_idle=2)
+    conns = [pool.checkout() for _ in range(3)]
+
+    for conn in conns:
+        conn.close()
+
+    assert len(pool.idle) == 2
+
+
+def test_returned_connections_are_rolled_back_and_tuned(app, db):
+    pool = fileshare.ConnectionPool(fileshare.DATABASE, max_idle=1)
+    conn = pool.checkout()
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == fileshare.SQLITE_BUSY_TIMEOUT_MS
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute("INSERT INTO download_logs (file_id, ip_address) VALUES ('gone', '127.0.0.1')")
+
+    conn.close()
+
+    assert db.execute('SELECT COUNT(*) FROM download_logs').fetchone()[0] == 0
+    assert not pool.checkout().in_transaction
+
+
+def test_a_request_keeps_one_connection_however_often_it_closes(app):
+    with app.test_request_context():
+        conn = fileshare.get_db_connection()
+        conn.close()
+        assert fileshare.get_db_connection() is conn
+        assert conn not in fileshare.db_pool.idle
+    assert conn in fileshare.db_pool.idle
+
+
+def test_connections_never_cross_a_fork(app, monkeypatch):
+    pool = fileshare.ConnectionPool(fileshare.DATABASE, max_idle=2)
+    parent = pool.checkout()
+    parent.close()
+
+    monkeypatch.setattr(fileshare.os, 'getpid', lambda: -1)
+    child = pool.checkout()
+
+    assert child is not parent
+    assert parent not in pool.idle
@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+import app as fileshare
+
+
+def upload_folder_files():
+    return sorted(entry.name for entry in os.scandir(fileshare.app.config['UPLOAD_FOLDER']) if entry.is_file())
+
+
+def blob(db, digest):
+    return db.execute('SELECT * FROM blobs WHERE digest = ?', (digest,)).fetchone()
+
+
+def test_upload_is_stored_under_its_digest(upload, db):
+    row = upload(b'unique content', 'unique.txt')
+    digest = hashlib.sha256(b'unique content').hexdigest()
+
+    assert row['sha256'] == row['stored_name'] == digest
+    assert blob(db, digest)['ref_count'] == 1
+    assert upload_folder_files() == [digest]
+
+
+def test_duplicate_uploads_share_one_blob(client, upload, db):
+    first = upload(b'same bytes', 'first.txt')
+    second = upload(b'same bytes', 'second.txt', description='copy')
+
+    assert first['id'] != second['id']
+    assert first['stored_name'] == second['stored_name']
+    assert blob(db, first['sha256'])['ref_count'] == 2
+    assert upload_folder_files() == [first['stored_name']]
+    assert client.get(f"/download/{second['id']}").get_data() == b'same bytes'
+
+
+def test_blob_outlives_all_but_its_last_reference(client, upload, db):
+    first = upload(b'shared', 'first.txt')
+    second = upload(b'shared', 'second.txt')
+
+    client.post(f"/delete/{first['id']}")
+    assert blob(db, first['sha256'])['ref_count'] == 1
+    assert client.get(f"/download/{second['id']}").get_data() == b'shared'
+
+    client.post(f"/delete/{second['id']}")
+    assert blob(db, first['sha256']) is None
+    assert upload_folder_files() == []
+
+
+def test_reupload_after_delete_stores_the_content_again(client, upload, db):
+    first = upload(b'comes back', 'first.txt')
+    client.post(f"/delete/{first['id']}")
+
+    second = upload(b'comes back', 'second.txt')
+
+    assert blob(db, second['sha256'])['ref_count'] == 1
+    assert client.get(f"/download/{second['id']}").get_data() == b'comes back'
+
+
+def skip(client, content, **fields):
+    return client.post('/upload/skip', json=dict({'sha256': hashlib.sha256(content).hexdigest(),
+                                                   'file_size': len(content), 'filename': 'skipped.txt'}, **fields))
+
+
+def test_skip_creates_a_file_from_stored_content(client, upload, db):
+    stored = upload(b'already here', 'original.txt')
+
+    response = skip(client, b'already here', description='no bytes sent', uploader='tester')
+
+    assert response.status_code == 201
+    row = db.execute('SELECT * FROM files WHERE id = ?', (response.json['id'],)).fetchone()
+    assert (row['original_name'], row['stored_name'], row['description'], row['uploader']) == \
+        ('skipped.txt', stored['stored_name'], 'no bytes sent', 'tester')
+    assert blob(db, stored['sha256'])['ref_count'] == 2
+    assert client.get(f"/download/{row['id']}").get_data() == b'already here'
+
+
+def test_skip_asks_for_an_upload_of_unknown_content(client, upload, db):
+    upload(b'stored', 'stored.txt')
+
+    assert skip(client, b'never uploaded').status_code == 404
+    # The digest alone is not proof of having the content; the size must match as well
+    assert skip(client, b'stored', file_size=99).status_code == 404
+    assert db.execute('SELECT COUNT(*) FROM files').fetchone()[0] == 1
+
+
+def test_skip_validates_its_request(client):
+    assert skip(client, b'x', sha256='not-a-digest').status_code == 400
+    assert skip(client, b'x', file_size='big').status_code == 400
+    assert skip(client, b'x', filename='').status_code == 400
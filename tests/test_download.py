@@ -0,0 +1,103 @@
+import re
+
+from werkzeug.http import http_date
+
+
+def download_count(db, file_id):
+    return db.execute('SELECT download_count FROM files WHERE id = ?', (file_id,)).fetchone()[0]
+
+
+def test_full_download(client, upload, db):
+    row = upload(b'hello world', 'hello.txt')
+
+    response = client.get(f"/download/{row['id']}")
+
+    assert response.status_code == 200
+    assert response.data == b'hello world'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag'] == f'"{row["sha256"]}"'
+    assert download_count(db, row['id']) == 1
+    assert db.execute('SELECT COUNT(*) FROM download_logs WHERE file_id = ?', (row['id'],)).fetchone()[0] == 1
+
+
+def test_single_range(client, upload, db):
+    row = upload(b'0123456789', 'digits.txt')
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=2-5'})
+
+    assert response.status_code == 206
+    assert response.data == b'2345'
+    assert response.headers['Content-Range'] == 'bytes 2-5/10'
+
+
+def test_suffix_and_open_ranges(client, upload):
+    row = upload(b'0123456789', 'digits.txt')
+
+    assert client.get(f"/download/{row['id']}", headers={'Range': 'bytes=-3'}).data == b'789'
+    assert client.get(f"/download/{row['id']}", headers={'Range': 'bytes=7-'}).data == b'789'
+
+
+def test_multiple_ranges_are_sent_as_multipart_byteranges(client, upload):
+    row = upload(b'0123456789', 'digits.txt')
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=0-1,8-9'})
+
+    assert response.status_code == 206
+    boundary = re.search(r'boundary=(\S+)', response.headers['Content-Type']).group(1)
+    parts = [part for part in response.data.split(f'--{boundary}'.encode()) if b'Content-Range' in part]
+    assert [part.split(b'\r\n\r\n', 1)[1].strip() for part in parts] == [b'01', b'89']
+    assert b'Content-Range: bytes 0-1/10' in parts[0]
+    assert b'Content-Range: bytes 8-9/10' in parts[1]
+
+
+def test_unsatisfiable_range(client, upload, db):
+    row = upload(b'0123456789', 'digits.txt')
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=50-60'})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */10'
+    assert download_count(db, row['id']) == 0
+
+
+def test_if_range_mismatch_sends_the_whole_file(client, upload):
+    row = upload(b'0123456789', 'digits.txt')
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=2-5', 'If-Range': '"stale"'})
+
+    assert response.status_code == 200
+    assert response.data == b'0123456789'
+
+
+def test_resumed_download_is_not_counted_again(client, upload, db):
+    row = upload(b'0123456789', 'digits.txt')
+
+    client.get(f"/download/{row['id']}", headers={'Range': 'bytes=0-4'})
+    client.get(f"/download/{row['id']}", headers={'Range': 'bytes=5-'})
+
+    assert download_count(db, row['id']) == 1
+
+
+def test_if_none_match_revalidates_without_counting(client, upload, db):
+    row = upload(b'cached content', 'c.txt')
+    etag = client.get(f"/download/{row['id']}").headers['ETag']
+
+    response = client.get(f"/download/{row['id']}", headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert download_count(db, row['id']) == 1
+
+
+def test_if_modified_since_revalidates_without_counting(client, upload, db):
+    row = upload(b'cached content', 'c.txt')
+    last_modified = client.get(f"/download/{row['id']}").headers['Last-Modified']
+
+    assert client.get(f"/download/{row['id']}", headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(f"/download/{row['id']}", headers={'If-Modified-Since': http_date(0)}).status_code == 200
+    assert download_count(db, row['id']) == 2
+
+
+def test_missing_file(client):
+    assert client.get('/download/nope').status_code == 404
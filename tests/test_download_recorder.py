@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+import app as fileshare
+
+
+class FailingConnection:
+    """Stands in for a database that is down: every statement fails"""
+
+    def __init__(self):
+        self.rolled_back = False
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def executemany(self, *args):
+        raise sqlite3.OperationalError('database is locked')
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def buffered(app):
+    # A long interval keeps the background flush out of the way; tests flush explicitly
+    app.config['DOWNLOAD_FLUSH_INTERVAL_MS'] = 60000
+    yield fileshare.download_recorder
+    fileshare.download_recorder.flush()
+
+
+def counters(db, file_id):
+    count = db.execute('SELECT download_count FROM files WHERE id = ?', (file_id,)).fetchone()[0]
+    logs = db.execute('SELECT COUNT(*) FROM download_logs WHERE file_id = ?', (file_id,)).fetchone()[0]
+    return count, logs
+
+
+def test_downloads_are_written_behind_in_one_flush(client, upload, db, buffered):
+    row = upload(b'popular', 'p.txt')
+    for _ in range(3):
+        client.get(f"/download/{row['id']}")
+    assert counters(db, row['id']) == (0, 0)
+
+    buffered.flush()
+
+    assert counters(db, row['id']) == (3, 3)
+
+
+def test_failed_flush_rolls_back_closes_and_retries(client, upload, db, buffered, monkeypatch):
+    row = upload(b'popular', 'p.txt')
+    client.get(f"/download/{row['id']}")
+    client.get(f"/download/{row['id']}")
+    failing = FailingConnection()
+    monkeypatch.setattr(fileshare, 'get_db_connection', lambda: failing)
+
+    buffered.flush()
+
+    assert failing.rolled_back and failing.closed
+    assert buffered.counts == {row['id']: 2} and len(buffered.logs) == 2
+    monkeypatch.undo()
+    buffered.flush()
+    assert counters(db, row['id']) == (2, 2)
+
+
+def test_backlog_is_capped_while_the_database_is_down(client, upload, db, buffered, monkeypatch):
+    row = upload(b'popular', 'p.txt')
+    monkeypatch.setattr(fileshare, 'DOWNLOAD_BACKLOG_MAX_EVENTS', 5)
+    dropped = buffered.dropped
+    for _ in range(8):
+        client.get(f"/download/{row['id']}")
+
+    monkeypatch.setattr(fileshare, 'get_db_connection', lambda: FailingConnection())
+    buffered.flush()
+
+    assert len(buffered.logs) == 5
+    assert buffered.counts == {row['id']: 5}
+    assert buffered.dropped - dropped == 3
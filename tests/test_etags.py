@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/api/files', '/api/stats', '/'])
+def test_unchanged_responses_revalidate_to_304(client, upload, path):
+    upload(b'content', 'content.txt')
+    first = client.get(path)
+    etag = first.headers['ETag']
+
+    again = client.get(path, headers={'If-None-Match': etag})
+
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    assert again.headers['ETag'] == etag
+
+
+@pytest.mark.parametrize('path', ['/api/files', '/api/stats'])
+def test_writes_change_the_api_etags(client, upload, path):
+    upload(b'first', 'first.txt')
+    etag = client.get(path).headers['ETag']
+
+    upload(b'second', 'second.txt')
+    response = client.get(path, headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_stale_etag_among_several_still_matches_the_current_one(client):
+    etag = client.get('/api/files').headers['ETag']
+
+    response = client.get('/api/files', headers={'If-None-Match': f'"stale", {etag}'})
+
+    assert response.status_code == 304
+
+
+def test_error_responses_carry_no_etag(client):
+    response = client.get('/api/files?limit=0')
+
+    assert response.status_code == 400
+    assert 'ETag' not in response.headers
@@ -0,0 +1,65 @@
+import pytest
+
+import app as fileshare
+
+
+@pytest.fixture(autouse=True)
+def streams_enabled(app):
+    app.config['SSE_ENABLED'] = True
+
+
+def next_event(response):
+    """The next chunk of a streamed response that is not a keep-alive"""
+    for chunk in response.response:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if not chunk.startswith(':'):
+            return chunk
+
+
+def test_stream_pushes_changes(client, upload):
+    response = client.get('/api/events')
+    try:
+        assert response.mimetype == 'text/event-stream'
+        assert next_event(response).startswith('retry:')
+
+        upload(b'pushed', 'pushed.txt')
+        event = next_event(response)
+
+        assert 'event: changes' in event
+        assert 'pushed.txt' in event
+    finally:
+        response.close()
+    assert fileshare.change_broadcaster.subscribers == 0
+
+
+def test_streams_beyond_the_limit_are_refused(app, client):
+    app.config['SSE_MAX_SUBSCRIBERS'] = 1
+    held = client.get('/api/events')
+    try:
+        refused = client.get('/api/events')
+    finally:
+        held.close()
+
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == str(fileshare.SSE_HEARTBEAT_INTERVAL)
+    reopened = client.get('/api/events')
+    assert reopened.status_code == 200
+    reopened.close()
+
+
+def test_head_requests_do_not_hold_a_subscription(client):
+    for _ in range(3):
+        response = client.head('/api/events')
+        assert response.status_code == 200
+        response.close()
+
+    assert fileshare.change_broadcaster.subscribers == 0
+
+
+def test_streams_are_off_unless_enabled(app, client):
+    app.config['SSE_ENABLED'] = False
+
+    response = client.get('/api/events')
+
+    assert response.status_code == 404
+    assert fileshare.change_broadcaster.subscribers == 0
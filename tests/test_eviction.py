@@ -0,0 +1,136 @@
+import hashlib
+import os
+
+import app as fileshare
+
+
+def upload_files(upload, db, count, size=100):
+    return [upload(bytes([index]) * size, f'{index}.bin')['id'] for index in range(count)]
+
+
+def set_column(db, column, values):
+    db.executemany(f'UPDATE files SET {column} = ? WHERE id = ?', [(value, file_id) for file_id, value in values])
+    db.commit()
+
+
+def remaining(db):
+    return {row[0] for row in db.execute('SELECT id FROM files')}
+
+
+def test_nothing_is_evicted_without_a_quota(upload, db):
+    ids = upload_files(upload, db, 3)
+
+    assert fileshare.evict_to_quota() == 0
+    assert remaining(db) == set(ids)
+
+
+def test_lru_evicts_the_least_recently_used(app, upload, db):
+    a, b, c = upload_files(upload, db, 3)
+    set_column(db, 'expires_at', [(a, '2099-01-03 00:00:00'), (b, '2099-01-01 00:00:00'),
+                                  (c, '2099-01-02 00:00:00')])
+    app.config['STORAGE_QUOTA_BYTES'] = 250
+
+    assert fileshare.evict_to_quota() == 1
+    assert remaining(db) == {a, c}
+
+
+def test_lfu_evicts_the_least_downloaded(app, upload, db):
+    a, b, c = upload_files(upload, db, 3)
+    set_column(db, 'download_count', [(a, 1), (b, 7), (c, 3)])
+    app.config.update(STORAGE_QUOTA_BYTES=250, EVICTION_POLICY='lfu')
+
+    assert fileshare.evict_to_quota() == 1
+    assert remaining(db) == {b, c}
+
+
+def test_gdsf_evicts_the_lowest_priority_and_advances_the_clock(app, upload, db):
+    a, b, c = upload_files(upload, db, 3)
+    set_column(db, 'gdsf_priority', [(a, 4.0), (b, 2.5), (c, 9.0)])
+    app.config.update(STORAGE_QUOTA_BYTES=250, EVICTION_POLICY='gdsf')
+
+    assert fileshare.evict_to_quota() == 1
+    assert remaining(db) == {a, c}
+    assert db.execute('SELECT gdsf_clock FROM stats').fetchone()[0] == 2.5
+
+
+def test_eviction_stops_at_the_target_ratio(app, upload, db):
+    upload_files(upload, db, 10)
+    app.config['STORAGE_QUOTA_BYTES'] = 900
+
+    assert fileshare.evict_to_quota() == 2
+    assert db.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 800
+
+
+def test_upload_over_quota_evicts_at_once(app, client, upload, db):
+    app.config['STORAGE_QUOTA_BYTES'] = 350
+    first, *rest = upload_files(upload, db, 3)
+    set_column(db, 'expires_at', [(first, '2000-01-01 00:00:00')])
+
+    latest = upload(b'z' * 100, 'latest.bin')['id']
+
+    assert remaining(db) == set(rest) | {latest}
+    assert db.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 300
+
+
+def test_session_upload_over_quota_evicts_at_once(app, client, upload, db):
+    app.config['STORAGE_QUOTA_BYTES'] = 350
+    first, *rest = upload_files(upload, db, 3)
+    set_column(db, 'expires_at', [(first, '2000-01-01 00:00:00')])
+
+    session = client.post('/upload/sessions', json={'filename': 'chunked.bin', 'file_size': 100,
+                                                    'chunk_size': 100}).json
+    client.put(f"/upload/sessions/{session['session_id']}/chunks/0", data=b'c' * 100)
+    response = client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    assert response.status_code == 200
+    assert first not in remaining(db)
+    assert len(remaining(db)) == 3
+
+
+def test_duplicate_uploads_take_no_quota(app, client, upload, db):
+    app.config['STORAGE_QUOTA_BYTES'] = 350
+    ids = upload_files(upload, db, 3)
+
+    content = bytes([1]) * 100
+    skipped = client.post('/upload/skip', json={'sha256': hashlib.sha256(content).hexdigest(),
+                                                 'file_size': 100, 'filename': 'again.bin'})
+    duplicate = upload(content, 'copy.bin')['id']
+
+    assert skipped.status_code == 201
+    assert remaining(db) == set(ids) | {skipped.json['id'], duplicate}
+    assert db.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 300
+
+
+def test_evicting_a_shared_file_frees_nothing(app, upload, db):
+    a, b = upload(b'x' * 100, 'a.bin')['id'], upload(b'x' * 100, 'b.bin')['id']
+    c = upload(b'y' * 100, 'c.bin')['id']
+    set_column(db, 'expires_at', [(a, '2099-01-01 00:00:00'), (b, '2099-01-02 00:00:00'),
+                                  (c, '2099-01-03 00:00:00')])
+    app.config['STORAGE_QUOTA_BYTES'] = 150
+
+    # Evicting a alone would leave the blob b still holds on disk
+    assert fileshare.evict_to_quota() == 2
+    assert remaining(db) == {c}
+    assert db.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 100
+
+
+def test_content_awaiting_reclaim_counts_towards_the_quota(app, upload, db):
+    upload_files(upload, db, 3)
+    with open(os.path.join(app.config['RECLAIM_FOLDER'], 'pending'), 'wb') as f:
+        f.write(b'p' * 100)
+    db.execute("INSERT INTO reclaim_queue (trash_name, stored_name, file_size) VALUES ('pending', 'pending', 100)")
+    db.commit()
+    app.config['STORAGE_QUOTA_BYTES'] = 320
+
+    # 300 stored bytes alone are under the quota; with 100 more on their way out they are not
+    assert fileshare.evict_to_quota() == 1
+    assert db.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 200
+
+
+def test_concurrent_evictors_defer_to_the_one_running(app, upload, db):
+    upload_files(upload, db, 3)
+    app.config['STORAGE_QUOTA_BYTES'] = 250
+
+    with fileshare.file_lock('eviction'):
+        assert fileshare.evict_to_quota() == 0
+    assert len(remaining(db)) == 3
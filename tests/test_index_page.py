@@ -0,0 +1,56 @@
+import gzip
+import os
+import time
+
+import app as fileshare
+
+
+def page_source():
+    with open(fileshare.index_page.path, 'rb') as f:
+        return f.read()
+
+
+def test_page_is_served_from_memory(client, monkeypatch):
+    def no_reads(*args, **kwargs):
+        raise AssertionError('the page was read from disk')
+    monkeypatch.setattr(fileshare.IndexPage, 'load', no_reads)
+
+    response = client.get('/')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/html'
+    # Streams are opt-in, so by default the page polls for changes
+    assert b'const pushEnabled = false;' in response.get_data()
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get('/')
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+
+def test_template_changes_are_picked_up_when_auto_reloading(app, client, monkeypatch):
+    original = page_source()
+    monkeypatch.setitem(app.config, 'TEMPLATES_AUTO_RELOAD', True)
+    before = client.get('/')
+    try:
+        with open(fileshare.index_page.path, 'wb') as f:
+            f.write(original.replace(b'</body>', b'<p>reloaded</p></body>'))
+        # Make sure the modification time moves even on coarse-grained filesystems
+        later = time.time() + 5
+        os.utime(fileshare.index_page.path, (later, later))
+
+        after = client.get('/')
+    finally:
+        with open(fileshare.index_page.path, 'wb') as f:
+            f.write(original)
+        fileshare.index_page.load()
+
+    assert b'reloaded' in after.get_data()
+    assert after.headers['ETag'] != before.headers['ETag']
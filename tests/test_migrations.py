@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+import app as fileshare
+
+# The schema and rows of a database written by the app before any migration existed
+LEGACY_SCHEMA = '''
+    CREATE TABLE files (
+        id TEXT PRIMARY KEY,
+        original_name TEXT NOT NULL,
+        stored_name TEXT NOT NULL,
+        file_size INTEGER NOT NULL,
+        mime_type TEXT,
+        description TEXT,
+        uploader TEXT,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        download_count INTEGER DEFAULT 0,
+        last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE download_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id TEXT,
+        download_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ip_address TEXT,
+        FOREIGN KEY (file_id) REFERENCES files (id)
+    );
+    INSERT INTO files (id, original_name, stored_name, file_size, mime_type, uploader, upload_date,
+                       download_count, last_accessed)
+    VALUES ('a', 'a.txt', 'a_a.txt', 100, 'text/plain', 'alice', '2026-01-01 10:00:00', 3, '2026-02-01 10:00:00'),
+           ('b', 'b.txt', 'b_b.txt', 250, 'text/plain', 'bob', '2026-01-02 10:00:00', 0, '2026-01-02 10:00:00');
+    INSERT INTO download_logs (file_id, ip_address) VALUES ('a', '127.0.0.1');
+'''
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Point the app's migrations, and the locks next to the database, at a scratch file"""
+    path = str(tmp_path / 'fileshare.db')
+    monkeypatch.setattr(fileshare, 'DATABASE', path)
+    return path
+
+
+def open_db(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def test_fresh_database_reaches_the_latest_version(database):
+    fileshare.init_database()
+
+    conn = open_db(database)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == fileshare.MIGRATIONS[-1][0]
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert {'sha256', 'expires_at', 'gdsf_priority'} <= columns(conn, 'files')
+    assert {'file_changes', 'stats', 'daily_uploads', 'reclaim_queue', 'scrub_progress'} <= \
+        {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+
+
+def test_legacy_database_is_upgraded_with_its_rows(database):
+    conn = open_db(database)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+
+    fileshare.init_database()
+
+    conn = open_db(database)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == fileshare.MIGRATIONS[-1][0]
+    rows = {row['id']: row for row in conn.execute('SELECT * FROM files')}
+    assert rows['a']['expires_at'] == '2026-03-03 10:00:00'  # last access plus 30 days
+    assert rows['b']['expires_at'] == '2026-02-01 10:00:00'
+    assert rows['a']['gdsf_priority'] == pytest.approx(4 / 100)
+    assert rows['a']['sha256'] is None
+    stats = conn.execute('SELECT total_files, total_size FROM stats').fetchone()
+    assert tuple(stats) == (2, 350)
+    # Files from before content addressing have no blob and count towards storage on their own
+    assert conn.execute('SELECT stored_bytes FROM stats').fetchone()[0] == 350
+    assert conn.execute('SELECT COUNT(*) FROM download_logs').fetchone()[0] == 1
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert 'idx_files_expires_at' in indexes
+    assert 'idx_files_last_accessed' not in indexes
+    conn.close()
+
+
+def test_migrations_run_once(database, capsys):
+    fileshare.init_database()
+    capsys.readouterr()
+
+    fileshare.init_database()
+
+    assert 'Applying database migration' not in capsys.readouterr().out
+
+
+def test_interrupted_upgrade_resumes_at_the_failed_migration(database, monkeypatch):
+    def failing_migration(conn):
+        """Stands in for migration 6 failing halfway"""
+        raise sqlite3.OperationalError('disk I/O error')
+
+    migrations = list(fileshare.MIGRATIONS)
+    monkeypatch.setattr(fileshare, 'MIGRATIONS', [(version, failing_migration if version == 6 else migrate)
+                                                  for version, migrate in migrations])
+    with pytest.raises(sqlite3.OperationalError):
+        fileshare.init_database()
+    conn = open_db(database)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 5
+    conn.close()
+
+    monkeypatch.setattr(fileshare, 'MIGRATIONS', migrations)
+    fileshare.init_database()
+
+    conn = open_db(database)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == migrations[-1][0]
+    assert 'expires_at' in columns(conn, 'files')
+    conn.close()
@@ -0,0 +1,104 @@
+import os
+from urllib.parse import unquote
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+
+class StandInProxy:
+    """A stand-in for nginx or Apache in front of the app: it passes requests through and, when
+    the app answers with X-Accel-Redirect or X-Sendfile, streams the named file itself"""
+
+    def __init__(self, wsgi_app, accel_prefix, accel_root):
+        self.wsgi_app = wsgi_app
+        self.accel_prefix = accel_prefix
+        self.accel_root = accel_root
+        self.offloaded = []
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'] = status, headers
+
+        body = b''.join(self.wsgi_app(environ, capture))
+        headers = dict(captured['headers'])
+        if 'X-Accel-Redirect' in headers:
+            location = headers.pop('X-Accel-Redirect')
+            assert location.startswith(self.accel_prefix)
+            path = os.path.join(self.accel_root, unquote(location[len(self.accel_prefix):]))
+        elif 'X-Sendfile' in headers:
+            path = headers.pop('X-Sendfile')
+        else:
+            start_response(captured['status'], captured['headers'])
+            return [body]
+
+        # The app must not send any bytes of its own when it hands the transfer off
+        assert body == b''
+        self.offloaded.append(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        status = '200 OK'
+        byte_range = environ.get('HTTP_RANGE')
+        if byte_range:
+            start, end = byte_range.split('=')[1].split('-')
+            start, end = int(start), int(end or len(data) - 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+            data, status = data[start:end + 1], '206 Partial Content'
+        headers['Content-Length'] = str(len(data))
+        start_response(status, list(headers.items()))
+        return [data]
+
+
+def proxied(app):
+    proxy = StandInProxy(app.wsgi_app, app.config['DOWNLOAD_ACCEL_PREFIX'], app.config['UPLOAD_FOLDER'])
+    return proxy, Client(proxy, Response)
+
+
+def test_x_accel_redirect_hands_the_transfer_to_the_proxy(app, upload, db):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-accel'
+    row = upload(b'offloaded bytes' * 100, 'big.bin')
+    proxy, client = proxied(app)
+
+    response = client.get(f"/download/{row['id']}")
+
+    assert response.status_code == 200
+    assert response.data == b'offloaded bytes' * 100
+    assert 'X-Accel-Redirect' not in response.headers
+    assert proxy.offloaded == [os.path.join(app.config['UPLOAD_FOLDER'], row['stored_name'])]
+    assert response.headers['Content-Disposition'] == 'attachment; filename="big.bin"'
+    assert db.execute('SELECT download_count FROM files WHERE id = ?', (row['id'],)).fetchone()[0] == 1
+
+
+def test_x_sendfile_names_the_absolute_blob_path(app, upload):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-sendfile'
+    row = upload(b'sendfile me', 'a.txt')
+    proxy, client = proxied(app)
+
+    response = client.get(f"/download/{row['id']}")
+
+    assert response.data == b'sendfile me'
+    assert proxy.offloaded == [os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], row['stored_name']))]
+
+
+def test_offloaded_range_requests_are_served_by_the_proxy_and_not_counted(app, upload, db):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-accel'
+    row = upload(b'0123456789', 'digits.txt')
+    _, client = proxied(app)
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=4-6'})
+
+    assert response.status_code == 206
+    assert response.data == b'456'
+    assert db.execute('SELECT download_count FROM files WHERE id = ?', (row['id'],)).fetchone()[0] == 0
+
+
+def test_offload_response_carries_no_body_of_its_own(app, client, upload):
+    app.config['DOWNLOAD_OFFLOAD'] = 'x-accel'
+    row = upload(b'payload', 'p.txt')
+
+    response = client.get(f"/download/{row['id']}")
+
+    assert response.headers['X-Accel-Redirect'] == app.config['DOWNLOAD_ACCEL_PREFIX'] + row['stored_name']
+    assert response.data == b''
+    assert 'Content-Length' not in response.headers
@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+import pytest
+
+import app as fileshare
+
+# Statements that read a whole (small) table on purpose
+FULL_SCANS_ALLOWED = (
+    # The reclaim queue is consumed in rowid order, a batch at a time
+    'SELECT id, trash_name, file_size FROM reclaim_queue ORDER BY id',
+    # Only open upload sessions are summed; abandoned ones expire after UPLOAD_SESSION_TTL
+    'SELECT COALESCE(SUM(file_size), 0) FROM upload_sessions',
+)
+
+
+@pytest.fixture
+def statements(app, monkeypatch):
+    """Every SQL statement the app runs during the test, as executed with its parameters"""
+    executed = []
+    checkout = fileshare.db_pool.checkout
+
+    def traced_checkout():
+        conn = checkout()
+        conn.set_trace_callback(executed.append)
+        return conn
+
+    monkeypatch.setattr(fileshare.db_pool, 'checkout', traced_checkout)
+    yield executed
+    for conn in fileshare.db_pool.idle:
+        conn.set_trace_callback(None)
+
+
+def assert_no_table_scans(statements, db):
+    checked = 0
+    for sql in statements:
+        if sql.split()[0].upper() not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            continue
+        normalized = ' '.join(sql.split())
+        if normalized.startswith(FULL_SCANS_ALLOWED):
+            continue
+        plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql)]
+        for step in plan:
+            # "SCAN t USING INDEX i" walks an index in order and stops at the LIMIT; a bare
+            # "SCAN t" reads the whole table and a temp b-tree sorts all matching rows
+            assert not (step.startswith('SCAN ') and ' USING ' not in step and step != 'SCAN CONSTANT ROW'), \
+                f'{normalized}\n  {plan}'
+            assert 'TEMP B-TREE' not in step, f'{normalized}\n  {plan}'
+        checked += 1
+    assert checked
+
+
+def test_listing_queries_use_indexes(client, upload, statements, db):
+    upload(b'a' * 10, 'a.txt', uploader='ann')
+    upload(b'b' * 20, 'b.bin')
+    upload(b'c' * 30, 'c.txt', uploader='ann')
+
+    for sort in fileshare.FILES_SORT_COLUMNS:
+        for order in ('asc', 'desc'):
+            response = client.get(f'/api/files?sort={sort}&order={order}&limit=1')
+            client.get(f'/api/files?sort={sort}&order={order}&limit=1&cursor={response.headers["X-Next-Cursor"]}')
+    for query in ('uploader=ann', 'mime_type=text/plain', 'min_size=15&max_size=25',
+                  'since=2000-01-01&until=2100-01-01', 'uploader=ann&sort=upload_date&order=asc'):
+        client.get(f'/api/files?{query}')
+    response = client.get('/api/files/export?format=ndjson')
+    assert len(response.data.splitlines()) == 3
+    client.get('/api/stats')
+    client.get('/api/changes')
+    client.get('/api/changes?since=1')
+
+    assert_no_table_scans(statements, db)
+
+
+def test_write_paths_use_indexes(client, upload, statements, db):
+    row = upload(b'content', 'a.txt')
+    upload(b'content', 'duplicate.txt')
+    digest = hashlib.sha256(b'content').hexdigest()
+    client.post('/upload/skip', json={'sha256': digest, 'file_size': 7, 'filename': 'skipped.txt'})
+    session = client.post('/upload/sessions', json={'filename': 'chunked.bin', 'file_size': 4, 'chunk_size': 4}).json
+    client.put(f"/upload/sessions/{session['session_id']}/chunks/0", data=b'abcd')
+    client.get(f"/upload/sessions/{session['session_id']}")
+    client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    client.get(f"/download/{row['id']}")
+    client.post(f"/delete/{row['id']}")
+
+    assert_no_table_scans(statements, db)
+
+
+def test_retention_eviction_and_scrub_use_indexes(app, upload, statements, db):
+    for index in range(3):
+        upload(bytes([index]) * (index + 1) * 10, f'{index}.bin')
+    db.execute("UPDATE files SET expires_at = '2000-01-01 00:00:00' WHERE original_name = '0.bin'")
+    db.commit()
+
+    fileshare.cleanup_old_files()
+    for policy in fileshare.EVICTION_ORDERS:
+        app.config.update(STORAGE_QUOTA_BYTES=1, EVICTION_POLICY=policy)
+        upload(policy.encode() * 10, f'{policy}.bin')
+        fileshare.evict_to_quota()
+    fileshare.scrub(repair=True)
+
+    assert_no_table_scans(statements, db)
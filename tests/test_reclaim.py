@@ -0,0 +1,68 @@
+import os
+
+import app as fileshare
+
+
+def folder_files(folder):
+    return sorted(entry.name for entry in os.scandir(folder) if entry.is_file())
+
+
+def crash_mid_delete(stored_name):
+    """Do what a delete does up to its commit, then lose the transaction as a crash would"""
+    conn = fileshare.db_pool.checkout()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    assert fileshare.trash_file(cursor, stored_name)
+    conn.rollback()
+    conn.close()
+
+
+def test_delete_reclaims_the_content(client, upload, db):
+    row = upload(b'doomed', 'doomed.txt')
+
+    response = client.post(f"/delete/{row['id']}")
+
+    assert response.status_code in (200, 302)
+    assert folder_files(fileshare.app.config['UPLOAD_FOLDER']) == []
+    assert folder_files(fileshare.app.config['RECLAIM_FOLDER']) == []
+    assert db.execute('SELECT COUNT(*) FROM reclaim_queue').fetchone()[0] == 0
+
+
+def test_recover_puts_back_content_of_a_delete_that_never_committed(client, upload):
+    row = upload(b'survivor', 'survivor.txt')
+    crash_mid_delete(row['stored_name'])
+    assert client.get(f"/download/{row['id']}").status_code == 404
+
+    assert fileshare.reclaimer.recover() == 1
+
+    assert folder_files(fileshare.app.config['RECLAIM_FOLDER']) == []
+    response = client.get(f"/download/{row['id']}")
+    assert response.status_code == 200
+    assert response.get_data() == b'survivor'
+
+
+def test_recover_queues_debris_nothing_refers_to(upload, db):
+    row = upload(b'orphaned', 'orphaned.txt')
+    crash_mid_delete(row['stored_name'])
+    db.execute('DELETE FROM files')
+    db.execute('DELETE FROM blobs')
+    db.commit()
+
+    assert fileshare.reclaimer.recover() == 0
+    assert db.execute('SELECT stored_name FROM reclaim_queue').fetchone()[0] == row['stored_name']
+
+    fileshare.reclaimer.reclaim()
+    assert folder_files(fileshare.app.config['RECLAIM_FOLDER']) == []
+
+
+def test_recover_leaves_queued_entries_alone(upload, db):
+    row = upload(b'queued', 'queued.txt')
+    conn = fileshare.db_pool.checkout()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    fileshare.remove_file_row(cursor, conn.execute('SELECT * FROM files WHERE id = ?', (row['id'],)).fetchone())
+    conn.commit()
+    conn.close()
+
+    assert fileshare.reclaimer.recover() == 0
+    assert db.execute('SELECT COUNT(*) FROM reclaim_queue').fetchone()[0] == 1
@@ -0,0 +1,84 @@
+import time
+
+import app as fileshare
+
+
+def counting_stats(monkeypatch):
+    """Count how often /api/stats is actually computed"""
+    calls = []
+    collect_stats = fileshare.collect_stats
+
+    def counted(cursor):
+        calls.append(1)
+        return collect_stats(cursor)
+    monkeypatch.setattr(fileshare, 'collect_stats', counted)
+    return calls
+
+
+def test_repeated_requests_are_served_from_the_cache(client, upload, monkeypatch):
+    upload(b'cached', 'cached.txt')
+    calls = counting_stats(monkeypatch)
+    hits = fileshare.response_cache.hits
+
+    first = client.get('/api/stats')
+    second = client.get('/api/stats')
+
+    assert len(calls) == 1
+    assert second.get_data() == first.get_data()
+    assert fileshare.response_cache.hits == hits + 1
+
+
+def test_writes_invalidate_cached_responses(client, upload):
+    upload(b'one', 'one.txt')
+    assert len(client.get('/api/files').json) == 1
+
+    upload(b'two', 'two.txt')
+
+    assert len(client.get('/api/files').json) == 2
+    assert client.get('/api/stats').json['total_files'] == 2
+
+
+def test_writes_in_other_processes_invalidate_too(client, upload, monkeypatch):
+    upload(b'one', 'one.txt')
+    calls = counting_stats(monkeypatch)
+    client.get('/api/stats')
+
+    # Another worker process maps the same generation file
+    fileshare.WriteGeneration(fileshare.GENERATION_FILE).bump()
+    client.get('/api/stats')
+
+    assert len(calls) == 2
+
+
+def test_query_strings_are_cached_separately(client, upload):
+    upload(b'a', 'a.txt', uploader='alice')
+    upload(b'b', 'b.txt', uploader='bob')
+
+    alice = client.get('/api/files?uploader=alice').json
+    bob = client.get('/api/files?uploader=bob').json
+
+    assert [row['uploader'] for row in alice] == ['alice']
+    assert [row['uploader'] for row in bob] == ['bob']
+
+
+def test_entries_expire_after_the_ttl(app, client, monkeypatch):
+    app.config['RESPONSE_CACHE_TTL'] = 0.05
+    calls = counting_stats(monkeypatch)
+
+    client.get('/api/stats')
+    time.sleep(0.1)
+    client.get('/api/stats')
+
+    assert len(calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted(client, monkeypatch):
+    monkeypatch.setattr(fileshare.response_cache, 'max_entries', 2)
+    evictions = fileshare.response_cache.evictions
+
+    for page_size in (1, 2, 3):
+        client.get(f'/api/files?limit={page_size}')
+
+    assert len(fileshare.response_cache.entries) == 2
+    assert fileshare.response_cache.evictions == evictions + 1
+    assert client.get('/admin/metrics').json['response_cache']['entries'] == 2
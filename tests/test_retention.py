@@ -0,0 +1,128 @@
+import threading
+import time
+
+import app as fileshare
+
+
+def expire(db, *names):
+    db.executemany("UPDATE files SET expires_at = '2000-01-01 00:00:00' WHERE original_name = ?",
+                   [(name,) for name in names])
+    db.commit()
+
+
+def names(db):
+    return sorted(row[0] for row in db.execute('SELECT original_name FROM files'))
+
+
+def wait_for_sweeps(count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while fileshare.retention_worker.sweeps < count:
+        assert time.monotonic() < deadline, 'sweep did not run'
+        time.sleep(0.01)
+
+
+def test_expired_files_are_removed_in_batches(upload, db, monkeypatch):
+    monkeypatch.setattr(fileshare, 'RETENTION_BATCH_SIZE', 2)
+    monkeypatch.setattr(fileshare, 'RETENTION_BATCH_PAUSE', 0)
+    for index in range(5):
+        upload(f'content {index}'.encode(), f'{index}.txt')
+    expire(db, '0.txt', '1.txt', '2.txt', '3.txt')
+    batches = []
+
+    removed = fileshare.cleanup_old_files(batches.append)
+
+    assert removed == 4
+    assert batches == [2, 2]
+    assert names(db) == ['4.txt']
+    assert db.execute('SELECT COUNT(*) FROM blobs').fetchone()[0] == 1
+    assert db.execute('SELECT total_files FROM stats').fetchone()[0] == 1
+
+
+def test_expired_files_lose_their_download_logs(client, upload, db):
+    row = upload(b'old', 'old.txt')
+    client.get(f"/download/{row['id']}")
+    expire(db, 'old.txt')
+
+    fileshare.cleanup_old_files()
+
+    assert db.execute('SELECT COUNT(*) FROM download_logs').fetchone()[0] == 0
+
+
+def test_downloads_push_expiry_back(client, upload, db):
+    row = upload(b'kept', 'kept.txt')
+    expire(db, 'kept.txt')
+
+    client.get(f"/download/{row['id']}")
+    fileshare.cleanup_old_files()
+
+    assert names(db) == ['kept.txt']
+
+
+def test_admin_cleanup_sweeps_in_the_background(client, upload, db):
+    upload(b'old', 'old.txt')
+    expire(db, 'old.txt')
+    sweeps = fileshare.retention_worker.sweeps
+
+    response = client.post('/admin/cleanup')
+
+    assert response.status_code == 202
+    wait_for_sweeps(sweeps + 1)
+    assert names(db) == []
+    assert client.get('/admin/metrics').json['retention']['last_sweep']['removed'] == 1
+
+
+def test_admin_cleanup_is_queued_behind_a_running_sweep(client, upload, db):
+    upload(b'old', 'old.txt')
+    expire(db, 'old.txt')
+    sweeps = fileshare.retention_worker.sweeps
+    held, release = threading.Event(), threading.Event()
+
+    def other_sweeper():
+        # A separate open of the lock file excludes like another process would
+        with fileshare.file_lock('retention'):
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=other_sweeper)
+    thread.start()
+    held.wait()
+    try:
+        response = client.post('/admin/cleanup')
+        time.sleep(0.1)
+        assert names(db) == ['old.txt']
+    finally:
+        release.set()
+        thread.join()
+
+    assert response.status_code == 202
+    wait_for_sweeps(sweeps + 1)
+    assert names(db) == []
+
+
+def test_leader_wakes_for_requests_from_other_processes():
+    requested = fileshare.sweep_requests.current()
+    woke = threading.Event()
+
+    def leader_wait():
+        fileshare.retention_worker._wait(requested, 30)
+        woke.set()
+
+    thread = threading.Thread(target=leader_wait)
+    thread.start()
+    # A separate mapping of the counter file, as another worker process has
+    fileshare.WriteGeneration(fileshare.SWEEP_REQUEST_FILE).bump()
+
+    assert woke.wait(fileshare.SWEEP_REQUEST_POLL + 2)
+    thread.join()
+
+
+def test_admin_cleanup_signals_the_leader_of_any_process(app, client, monkeypatch):
+    # Stand in for a process whose worker is not the leader
+    monkeypatch.setattr(fileshare.retention_worker, 'ensure_started', lambda: None)
+    monkeypatch.setitem(app.config, 'RETENTION_INTERVAL', 3600)
+    requested = fileshare.sweep_requests.current()
+
+    response = client.post('/admin/cleanup')
+
+    assert response.status_code == 202
+    assert fileshare.sweep_requests.current() == requested + 1
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+
+import app as fileshare
+
+
+def make_orphans(count):
+    """Write upload folder files no row refers to, old enough for the scrubber to judge"""
+    folder = fileshare.app.config['UPLOAD_FOLDER']
+    for index in range(count):
+        path = os.path.join(folder, f'orphan-{index:02}')
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        os.utime(path, (0, 0))
+
+
+def upload_folder_files():
+    return sorted(entry.name for entry in os.scandir(fileshare.app.config['UPLOAD_FOLDER']) if entry.is_file())
+
+
+def test_clean_store_reports_nothing(upload):
+    upload(b'one', 'one.txt')
+    upload(b'two', 'two.txt')
+
+    report = fileshare.scrub()
+
+    assert report['finished']
+    assert report['scanned_files'] == 2
+    assert report['orphan_files'] == report['dangling_rows'] == report['ref_count_mismatches'] == 0
+
+
+def test_repair_reaches_every_orphan_across_batches(app, upload, monkeypatch):
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_SIZE', 5)
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_PAUSE', 0)
+    kept = upload(b'kept', 'kept.txt')
+    make_orphans(20)
+
+    report = fileshare.scrub(repair=True)
+
+    assert report['finished']
+    assert report['orphan_files'] == report['repaired'] == 20
+    assert upload_folder_files() == [kept['stored_name']]
+
+
+def test_a_run_lists_the_folder_once(app, upload, monkeypatch):
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_SIZE', 5)
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_PAUSE', 0)
+    make_orphans(20)
+    folder = fileshare.app.config['UPLOAD_FOLDER']
+    listings = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        if path == folder:
+            listings.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(fileshare.os, 'scandir', counting_scandir)
+
+    report = fileshare.scrub(repair=True)
+
+    assert report['orphan_files'] == 20
+    assert len(listings) == 1
+
+
+def test_batch_limited_runs_resume_where_they_stopped(app, monkeypatch):
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_SIZE', 5)
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_PAUSE', 0)
+    make_orphans(12)
+
+    first = fileshare.scrub(repair=False, max_batches=2)
+    second = fileshare.scrub(repair=False)
+
+    assert 'finished' not in first
+    assert second['resumed_at'].startswith('upload_folder orphan-')
+    # Directory order is arbitrary, but the two runs split the folder between them
+    assert first['orphan_files'] + second['orphan_files'] == 12
+
+
+def test_resume_starts_over_when_its_name_is_gone(app, monkeypatch):
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_SIZE', 5)
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_PAUSE', 0)
+    make_orphans(12)
+    fileshare.scrub(max_batches=1)
+    position = fileshare.scrub(max_batches=0)['resumed_at'].split()[1]
+    os.remove(os.path.join(fileshare.app.config['UPLOAD_FOLDER'], position))
+
+    report = fileshare.scrub(repair=True)
+
+    assert report['finished']
+    assert upload_folder_files() == []
+
+
+def test_dangling_rows_and_ref_counts_are_repaired(upload, db):
+    gone = upload(b'gone', 'gone.txt')
+    shared = upload(b'shared', 'a.txt')
+    upload(b'shared', 'b.txt')
+    os.remove(os.path.join(fileshare.app.config['UPLOAD_FOLDER'], gone['stored_name']))
+    db.execute('UPDATE blobs SET ref_count = 5 WHERE digest = ?', (shared['stored_name'],))
+    db.commit()
+
+    report = fileshare.scrub(repair=True)
+
+    assert report['dangling_rows'] == 1
+    assert report['ref_count_mismatches'] == 1
+    assert db.execute('SELECT COUNT(*) FROM files WHERE id = ?', (gone['id'],)).fetchone()[0] == 0
+    assert db.execute('SELECT ref_count FROM blobs WHERE digest = ?', (shared['stored_name'],)).fetchone()[0] == 2
+
+
+def test_report_only_saves_progress_despite_concurrent_writers(app, upload, monkeypatch):
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_SIZE', 1)
+    monkeypatch.setattr(fileshare, 'SCRUB_BATCH_PAUSE', 0)
+    upload(b'one', 'one.txt')
+    upload(b'two', 'two.txt')
+    scrub_files = fileshare.SCRUBBERS['files']
+
+    def scrub_files_while_another_writer_commits(cursor, position, repair, report):
+        result = scrub_files(cursor, position, repair, report)
+        writer = sqlite3.connect(fileshare.DATABASE)
+        writer.execute("UPDATE files SET description = 'edited'")
+        writer.commit()
+        writer.close()
+        return result
+
+    monkeypatch.setitem(fileshare.SCRUBBERS, 'files', scrub_files_while_another_writer_commits)
+
+    report = fileshare.scrub()
+
+    assert report['finished']
+    assert report['scanned_rows'] >= 2
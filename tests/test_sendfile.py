@@ -0,0 +1,91 @@
+import http.client
+import os
+import socket
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import app as fileshare
+
+
+@pytest.fixture
+def server(app):
+    """The app behind Werkzeug's own server, whose socket downloads are sendfile()d to"""
+    httpd = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    yield httpd.server_port
+    httpd.shutdown()
+    thread.join()
+
+
+def fetch(port, path, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', path, headers=headers or {})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response, body
+
+
+@pytest.fixture
+def content():
+    return os.urandom(256 * 1024 + 17)
+
+
+def test_full_and_ranged_downloads_through_sendfile(server, upload, content, monkeypatch):
+    row = upload(content, 'big.bin')
+    sent = []
+    sendfile = fileshare.iter_file_parts
+
+    def recording(environ, *args):
+        sent.append(environ.get('werkzeug.socket') is not None)
+        return sendfile(environ, *args)
+    monkeypatch.setattr(fileshare, 'iter_file_parts', recording)
+
+    full, full_body = fetch(server, f"/download/{row['id']}")
+    part, part_body = fetch(server, f"/download/{row['id']}", {'Range': 'bytes=1000-70999'})
+    multi, multi_body = fetch(server, f"/download/{row['id']}", {'Range': 'bytes=0-9,-10'})
+
+    assert (full.status, full_body) == (200, content)
+    assert (part.status, part_body) == (206, content[1000:71000])
+    assert multi.status == 206
+    assert content[:10] in multi_body and content[-10:] in multi_body
+    assert sent == [True, True, True]
+
+
+def test_wsgi_file_wrapper_is_used_where_the_server_offers_it(client, upload, content):
+    row = upload(content, 'big.bin')
+    wrapped = []
+
+    class FileWrapper:
+        def __init__(self, f, block_size):
+            wrapped.append(f.tell())
+            self.f = f
+
+        def __iter__(self):
+            return iter(lambda: self.f.read(8192), b'')
+
+        def close(self):
+            self.f.close()
+
+    response = client.get(f"/download/{row['id']}", headers={'Range': 'bytes=100-'},
+                          environ_overrides={'wsgi.file_wrapper': FileWrapper})
+
+    assert response.status_code == 206
+    assert response.get_data() == content[100:]
+    assert wrapped == [100]
+
+
+def test_sendfile_can_be_turned_off(app, server, upload, content, monkeypatch):
+    app.config['DOWNLOAD_SENDFILE'] = False
+    row = upload(content, 'big.bin')
+
+    def no_sendfile(*args, **kwargs):
+        raise AssertionError('sendfile used while turned off')
+    monkeypatch.setattr(socket.socket, 'sendfile', no_sendfile)
+
+    response, body = fetch(server, f"/download/{row['id']}")
+
+    assert (response.status, body) == (200, content)
@@ -0,0 +1,59 @@
+import app as fileshare
+
+
+def stats(client):
+    response = client.get('/api/stats')
+    assert response.status_code == 200
+    return response.json
+
+
+def test_stats_follow_uploads_and_deletes(client, upload):
+    assert stats(client) == {'total_files': 0, 'total_size': 0, 'files_today': 0}
+
+    first = upload(b'x' * 100, 'first.txt')
+    upload(b'y' * 50, 'second.txt')
+    assert stats(client) == {'total_files': 2, 'total_size': 150, 'files_today': 2}
+
+    client.post(f"/delete/{first['id']}")
+    assert stats(client) == {'total_files': 1, 'total_size': 50, 'files_today': 1}
+
+
+def test_duplicates_count_at_their_uploaded_size(client, upload):
+    upload(b'same' * 10, 'a.txt')
+    upload(b'same' * 10, 'b.txt')
+
+    assert stats(client)['total_size'] == 80
+
+
+def test_reconcile_reports_and_repairs_drift(client, upload, db):
+    upload(b'z' * 10, 'counted.txt')
+    db.execute('UPDATE stats SET total_files = 7, total_size = 1')
+    db.execute('DELETE FROM daily_uploads')
+    db.commit()
+    fileshare.write_generation.bump()
+    assert stats(client)['total_files'] == 7
+
+    conn = fileshare.db_pool.checkout()
+    drift = fileshare.reconcile_stats(conn)
+    assert {key for key, stored, actual in drift if not key[0].isdigit()} == {'total_files', 'total_size'}
+    assert len(drift) == 4  # and the day's files and bytes
+    assert fileshare.reconcile_stats(conn, repair=True) == drift
+    assert fileshare.reconcile_stats(conn) == []
+    conn.close()
+
+    assert stats(client) == {'total_files': 1, 'total_size': 10, 'files_today': 1}
+
+
+def test_reconcile_command(app, upload, db):
+    upload(b'q', 'q.txt')
+    db.execute('UPDATE stats SET total_files = 3')
+    db.commit()
+    runner = app.test_cli_runner()
+
+    report = runner.invoke(args=['reconcile-stats'])
+    repair = runner.invoke(args=['reconcile-stats', '--repair'])
+    clean = runner.invoke(args=['reconcile-stats'])
+
+    assert 'total_files: stored 3, actual 1' in report.output
+    assert 'Repaired 1 drifted values' in repair.output
+    assert 'Stats rollups match the files table' in clean.output
@@ -0,0 +1,66 @@
+import io
+import os
+
+import werkzeug.formparser
+
+import app as fileshare
+
+
+def upload_folder_files():
+    return sorted(entry.name for entry in os.scandir(fileshare.app.config['UPLOAD_FOLDER']) if entry.is_file())
+
+
+def post_file(client, content, name='file.txt', **form):
+    return client.post('/upload', data=dict(form, file=(io.BytesIO(content), name)),
+                       content_type='multipart/form-data')
+
+
+def test_upload_streams_into_the_upload_folder(upload, monkeypatch):
+    def no_temporary_files(*args, **kwargs):
+        raise AssertionError('the upload went through a temporary spool file')
+    monkeypatch.setattr(werkzeug.formparser, 'default_stream_factory', no_temporary_files)
+    content = os.urandom(3 * 1024 * 1024)
+
+    row = upload(content, 'big file.bin', description='streamed', uploader='tester')
+
+    assert (row['original_name'], row['file_size'], row['description'], row['uploader']) == \
+        ('big_file.bin', len(content), 'streamed', 'tester')
+    assert upload_folder_files() == [row['stored_name']]
+    with open(os.path.join(fileshare.app.config['UPLOAD_FOLDER'], row['stored_name']), 'rb') as f:
+        assert f.read() == content
+
+
+def test_upload_defaults_the_uploader(upload):
+    row = upload(b'hello', 'hello.txt')
+
+    assert row['uploader'] == 'Anonymous'
+    assert row['mime_type'] == 'text/plain'
+
+
+def test_failed_upload_leaves_nothing_behind(client, db, monkeypatch):
+    def broken_adopt_blob(*args):
+        raise RuntimeError('disk on fire')
+    monkeypatch.setattr(fileshare, 'adopt_blob', broken_adopt_blob)
+
+    response = post_file(client, b'lost')
+
+    assert response.status_code == 500
+    assert upload_folder_files() == []
+    assert db.execute('SELECT COUNT(*) FROM files').fetchone()[0] == 0
+
+
+def test_oversized_upload_is_refused_without_leftovers(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+
+    response = post_file(client, b'x' * 4096)
+
+    assert response.status_code == 413
+    assert upload_folder_files() == []
+
+
+def test_part_without_a_filename_is_discarded(client, db):
+    response = post_file(client, b'rejected', '')
+
+    assert response.status_code == 302
+    assert upload_folder_files() == []
+    assert db.execute('SELECT COUNT(*) FROM files').fetchone()[0] == 0
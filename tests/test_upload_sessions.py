@@ -0,0 +1,173 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+import app as fileshare
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes: 3 chunks of 4096, the last one short
+
+
+def start_session(client, content=CONTENT, chunk_size=4096, **fields):
+    response = client.post('/upload/sessions', json=dict(fields, filename='data.bin', file_size=len(content),
+                                                         chunk_size=chunk_size))
+    assert response.status_code == 201
+    return response.json
+
+
+def put_chunk(client, session, index, content=CONTENT):
+    chunk_size = session['chunk_size']
+    return client.put(f"/upload/sessions/{session['session_id']}/chunks/{index}",
+                      data=content[index * chunk_size:(index + 1) * chunk_size])
+
+
+def test_session_reports_chunks_and_commits(client, db):
+    session = start_session(client, description='chunked', uploader='tester')
+    assert session['total_chunks'] == 3
+
+    for index in range(3):
+        assert put_chunk(client, session, index).json == {'success': True, 'chunk_index': index,
+                                                          'size': min(4096, len(CONTENT) - index * 4096)}
+    status = client.get(f"/upload/sessions/{session['session_id']}").json
+    response = client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    assert status['received'] == [0, 1, 2]
+    assert response.status_code == 200
+    row = db.execute('SELECT * FROM files WHERE id = ?', (response.json['id'],)).fetchone()
+    assert (row['original_name'], row['file_size'], row['description'], row['uploader']) == \
+        ('data.bin', len(CONTENT), 'chunked', 'tester')
+    assert row['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert client.get(f"/download/{row['id']}").get_data() == CONTENT
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM upload_chunks').fetchone()[0] == 0
+
+
+def test_commit_lists_missing_chunks_and_resumes(client):
+    session = start_session(client)
+    put_chunk(client, session, 0)
+
+    incomplete = client.post(f"/upload/sessions/{session['session_id']}/commit")
+    assert incomplete.status_code == 409
+    assert incomplete.json['missing'] == [1, 2]
+
+    # A client that lost track of what it sent asks, then sends only the rest
+    received = client.get(f"/upload/sessions/{session['session_id']}").json['received']
+    for index in set(range(3)) - set(received):
+        put_chunk(client, session, index)
+    assert client.post(f"/upload/sessions/{session['session_id']}/commit").status_code == 200
+
+
+def test_chunks_must_fit_the_session(client):
+    session = start_session(client)
+    url = f"/upload/sessions/{session['session_id']}/chunks"
+
+    assert client.put(f'{url}/0', data=b'short').status_code == 400
+    assert client.put(f'{url}/3', data=b'x').status_code == 416
+    assert client.put('/upload/sessions/unknown/chunks/0', data=b'x').status_code == 404
+
+
+def test_session_limits_are_validated(client):
+    assert client.post('/upload/sessions', json={'file_size': 10}).status_code == 400
+    assert client.post('/upload/sessions', json={'filename': 'a.bin', 'file_size': 0}).status_code == 400
+    assert client.post('/upload/sessions', json={'filename': 'a.bin',
+                                                 'file_size': fileshare.MAX_FILE_SIZE + 1}).status_code == 413
+    assert client.post('/upload/sessions', json={'filename': 'a.bin', 'file_size': 10,
+                                                 'chunk_size': fileshare.MAX_CHUNK_SIZE + 1}).status_code == 400
+
+
+def test_reserved_space_is_capped(app, client):
+    app.config['UPLOAD_SESSIONS_MAX_RESERVED'] = 2 * len(CONTENT)
+    first, second = start_session(client), start_session(client)
+
+    response = client.post('/upload/sessions', json={'filename': 'more.bin', 'file_size': 1})
+
+    assert response.status_code == 507
+    assert sorted(os.listdir(app.config['UPLOAD_FOLDER'])) == sorted(
+        ['.reclaim', f"{first['session_id']}_data.bin", f"{second['session_id']}_data.bin"])
+    # Space held by a session is released once it is aborted
+    client.delete(f"/upload/sessions/{first['session_id']}")
+    assert start_session(client)
+
+
+def test_abort_discards_the_session(client, db):
+    session = start_session(client)
+    put_chunk(client, session, 0)
+
+    assert client.delete(f"/upload/sessions/{session['session_id']}").status_code == 200
+
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions').fetchone()[0] == 0
+    assert os.listdir(fileshare.app.config['UPLOAD_FOLDER']) == ['.reclaim']
+    assert client.get(f"/upload/sessions/{session['session_id']}").status_code == 404
+
+
+def test_failed_commit_leaves_no_blob_or_session(client, db, monkeypatch):
+    session = start_session(client)
+    for index in range(3):
+        put_chunk(client, session, index)
+
+    def fail(name):
+        raise RuntimeError('simulated failure after the file joined the blob store')
+    monkeypatch.setattr(fileshare.mimetypes, 'guess_type', fail)
+    response = client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    assert response.status_code == 500
+    assert db.execute('SELECT COUNT(*) FROM blobs').fetchone()[0] == 0
+    assert db.execute('SELECT COUNT(*) FROM upload_sessions').fetchone()[0] == 0
+    assert os.listdir(fileshare.app.config['UPLOAD_FOLDER']) == ['.reclaim']
+
+
+def test_abandoned_sessions_expire_by_utc_age(client, db, monkeypatch):
+    # A local zone far from UTC must not shift the cutoff against the UTC updated_at column
+    monkeypatch.setenv('TZ', 'Pacific/Kiritimati')
+    time.tzset()
+    try:
+        fresh, stale = start_session(client), start_session(client)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for session, age in ((fresh, datetime.timedelta(hours=23)), (stale, datetime.timedelta(hours=25))):
+            db.execute('UPDATE upload_sessions SET updated_at = ? WHERE id = ?',
+                       ((now - age).strftime('%Y-%m-%d %H:%M:%S'), session['session_id']))
+        db.commit()
+
+        fileshare.cleanup_old_files()
+    finally:
+        monkeypatch.delenv('TZ')
+        time.tzset()
+
+    assert [row[0] for row in db.execute('SELECT id FROM upload_sessions')] == [fresh['session_id']]
+
+
+def test_chunks_arrive_out_of_order_and_in_parallel(app, client, db):
+    content = os.urandom(64 * 1024)
+    session = start_session(client, content, chunk_size=4096)
+    order = list(range(session['total_chunks']))[::-1]
+    results = []
+
+    def send(indexes):
+        # Each thread is its own connection, like a browser's parallel requests
+        worker = app.test_client()
+        results.extend(put_chunk(worker, session, index, content).status_code for index in indexes)
+
+    threads = [threading.Thread(target=send, args=(order[start::4],)) for start in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    response = client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    assert results == [200] * session['total_chunks']
+    assert response.status_code == 200
+    assert client.get(f"/download/{response.json['id']}").get_data() == content
+
+
+def test_retried_chunk_replaces_the_earlier_attempt(client):
+    session = start_session(client)
+    for index in range(3):
+        put_chunk(client, session, index, b'\0' * len(CONTENT))
+    put_chunk(client, session, 1)
+    put_chunk(client, session, 0)
+    put_chunk(client, session, 2)
+
+    response = client.post(f"/upload/sessions/{session['session_id']}/commit")
+
+    assert client.get(f"/download/{response.json['id']}").get_data() == CONTENT